@@ -7,10 +7,30 @@ import time
 import argparse
 from urllib.parse import urlparse
 import requests
-import gzip
-import shutil
+from requests.adapters import HTTPAdapter
+import mmap
 import datetime
 import logging
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from operator import itemgetter
+from xml.sax.saxutils import escape
+
+try:
+    # ISA-L's SIMD inflate is a drop-in replacement for the gzip module
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
+
+try:
+    # RapidFuzz scores a name against every candidate in one C call
+    from rapidfuzz import fuzz, process
+except ImportError:
+    print("Error: rapidfuzz package not found. Install with: pip install rapidfuzz")
+    sys.exit(1)
 
 # Configure logging
 logging.basicConfig(
@@ -20,6 +40,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger('channel_list_generator')
 
+# Shared HTTP session so repeated downloads reuse pooled keep-alive connections
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(pool_connections=20, pool_maxsize=20))
+_SESSION.mount('http://', HTTPAdapter(pool_connections=20, pool_maxsize=20))
+_SESSION.headers['User-Agent'] = 'home-epg/1.0'
+
+@dataclass(slots=True)
+class Channel:
+    """A channel entry from an M3U playlist"""
+    name: str
+    clean_name: str
+    tvg_id: str
+    info: str
+    url: str
+
+@dataclass(slots=True)
+class Match:
+    """Result of matching a playlist channel against the channel mappings"""
+    playlist_channel: Channel
+    mapping: dict | None
+    match_type: str
+    score: float | None = None
+
+# Buffer size for decompressing downloaded playlists
+DECOMPRESS_BUFFER_SIZE = 1024 * 1024
+
+# Precompiled patterns used by normalize_channel_name
+_RE_QUALITY = re.compile(r'\s+(HD|SD|FHD|UHD|4K|HEVC|H265|H\.265)\b')
+_RE_SUFFIX = re.compile(r'\s+(CHANNEL|TV|NETWORK)\s*$')
+_RE_PUNCT = re.compile(r'[^\w\s]')
+_RE_WS = re.compile(r'\s+')
+
+# Control characters that are not allowed in XML 1.0 and the quote entities
+# escaped on top of saxutils' default &, < and >
+_RE_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_XML_QUOTE_ENTITIES = {'"': '&quot;', "'": '&apos;'}
+
+# An #EXTINF line followed by its (non-comment) URL line, capturing the
+# tvg-id (anywhere on the line), the whole line, the channel name after the
+# first comma and the URL in one match. A blank URL line still counts and
+# gives an empty URL, but a trailing #EXTINF with no line after it doesn't
+_RE_EXTINF_ENTRY = re.compile(
+    rb'^(?:(?=[^\r\n]*?tvg-id="([^"\r\n]*)"))?(#EXTINF[^,\r\n]*,([^\r\n]+))\r?\n(?!#)([^\r\n]+|(?=[\r\n]))',
+    re.MULTILINE
+)
+
 def download_playlist(url, output_dir="playlist_data", force_download=False):
     """Download M3U playlist from a specified URL, only if existing file is older than 7 days"""
     try:
@@ -67,7 +133,31 @@ def download_playlist(url, output_dir="playlist_data", force_download=False):
         
         logger.info(f"Downloading playlist from {url}...")
         start_time = time.time()
-        response = requests.get(url)
+        
+        # If it's a gzip file, decompress it straight from the response stream
+        # instead of round-tripping the compressed file through disk
+        if url.endswith('.gz'):
+            with _SESSION.get(url, stream=True) as response:
+                response.raise_for_status()  # Raise an exception for HTTP errors
+                response.raw.decode_content = True
+                with gzip.GzipFile(fileobj=response.raw) as f_in:
+                    with open(output_path, 'wb') as f_out:
+                        # Reuse one preallocated buffer for every read; writes
+                        # this large go straight to the file without an extra
+                        # copy through the BufferedWriter
+                        buf = bytearray(DECOMPRESS_BUFFER_SIZE)
+                        view = memoryview(buf)
+                        while True:
+                            n = f_in.readinto(buf)
+                            if not n:
+                                break
+                            f_out.write(view[:n])
+            
+            download_time = time.time() - start_time
+            logger.info(f"Downloaded and decompressed to {output_path} in {download_time:.2f} seconds")
+            return output_path
+        
+        response = _SESSION.get(url)
         response.raise_for_status()  # Raise an exception for HTTP errors
         
         # Save the downloaded file
@@ -77,22 +167,6 @@ def download_playlist(url, output_dir="playlist_data", force_download=False):
         download_time = time.time() - start_time
         logger.info(f"Downloaded to {output_path} in {download_time:.2f} seconds")
         
-        # If it's a gzip file, decompress it
-        if url.endswith('.gz'):
-            decompressed_path = output_path.replace('.gz', '')
-            
-            logger.info(f"Decompressing {output_path}...")
-            start_time = time.time()
-            with gzip.open(output_path, 'rb') as f_in:
-                with open(decompressed_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-            
-            # Remove the compressed file after decompression
-            os.remove(output_path)
-            decompress_time = time.time() - start_time
-            logger.info(f"Decompressed to {decompressed_path} in {decompress_time:.2f} seconds")
-            return decompressed_path
-        
         return output_path
     except Exception as e:
         logger.error(f"Error downloading {url}: {e}")
@@ -108,47 +182,35 @@ def load_playlist_channels(file_path, country_prefix=None):
     start_time = time.time()
     try:
         channels = []
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
-        lines = content.splitlines()
+        with open(file_path, 'rb') as f:
+            # mmap cannot map an empty file
+            if os.fstat(f.fileno()).st_size == 0:
+                entries = []
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Extract every channel entry in a single pass
+                    entries = [entry.groups() for entry in _RE_EXTINF_ENTRY.finditer(mm)]
         
         # Get TV channels only
-        for i in range(len(lines)):
-            if lines[i].startswith("#EXTINF"):
-                # Get the channel info from current line
-                channel_info = lines[i]
-                # Extract channel name
-                channel_name_match = re.search(r',(.+)$', channel_info)
-                if channel_name_match:
-                    channel_name = channel_name_match.group(1).strip()
-                    
-                    # Apply country filter if specified
-                    include_channel = True
-                    if country_prefix:
-                        # Only include channels that start with the prefix
-                        include_channel = channel_name.startswith(country_prefix)
-                    
-                    if include_channel:
-                        # Get the URL from the next line
-                        if i + 1 < len(lines) and not lines[i + 1].startswith("#"):
-                            url = lines[i + 1].strip()
-                            # Extract tvg-id if available
-                            tvg_id_match = re.search(r'tvg-id="([^"]*)"', channel_info)
-                            tvg_id = tvg_id_match.group(1) if tvg_id_match else ""
-                            
-                            # Clean name (remove country prefix)
-                            clean_name = channel_name
-                            if country_prefix and channel_name.startswith(country_prefix):
-                                clean_name = channel_name[len(country_prefix):].strip()
-                            
-                            channels.append({
-                                'name': channel_name,
-                                'clean_name': clean_name,
-                                'tvg_id': tvg_id,
-                                'info': channel_info,
-                                'url': url
-                            })
+        for tvg_id, channel_info, channel_name, url in entries:
+            channel_name = channel_name.decode('utf-8', errors='ignore').strip()
+            
+            # Apply country filter if specified (only include channels that start with the prefix)
+            if country_prefix and not channel_name.startswith(country_prefix):
+                continue
+            
+            # Clean name (remove country prefix)
+            clean_name = channel_name
+            if country_prefix:
+                clean_name = channel_name[len(country_prefix):].strip()
+            
+            channels.append(Channel(
+                name=channel_name,
+                clean_name=clean_name,
+                tvg_id=tvg_id.decode('utf-8', errors='ignore') if tvg_id else "",
+                info=channel_info.decode('utf-8', errors='ignore'),
+                url=url.decode('utf-8', errors='ignore').strip()
+            ))
         
         elapsed_time = time.time() - start_time
         if country_prefix:
@@ -167,6 +229,37 @@ def clean_site_name(site_name):
         return site_name.split('_')[0]
     return site_name
 
+def _parse_mapping_file(file_path):
+    """Parse one channel mapping XML file into (channel_name, mapping_data) tuples"""
+    # Extract site name from filename (e.g., abc.com.channels.xml -> abc.com)
+    raw_site_name = os.path.basename(file_path).replace('.channels.xml', '')
+    site_name = clean_site_name(raw_site_name)
+    
+    # Stream-parse the XML file, processing each channel element as it closes
+    results = []
+    for event, channel in ET.iterparse(file_path, events=('end',)):
+        if channel.tag != 'channel':
+            continue
+        
+        site_id = channel.get('site_id', '')
+        xmltv_id = channel.get('xmltv_id', '')
+        lang = channel.get('lang', 'en')
+        channel_name = channel.text.strip() if channel.text else ''
+        
+        if site_id and channel_name:
+            results.append((channel_name, {
+                'site': site_name,
+                'site_id': site_id,
+                'xmltv_id': xmltv_id,
+                'lang': lang,
+                'original_name': channel_name
+            }))
+        
+        # Release the element's text and attributes once processed
+        channel.clear()
+    
+    return results
+
 def load_channel_mappings(channels_dir):
     """Load channel mappings from XML files in the channels directory"""
     if not os.path.exists(channels_dir):
@@ -180,72 +273,50 @@ def load_channel_mappings(channels_dir):
     normalized_mappings = {}  # Pre-compute normalized names for faster matching
     
     # Get all XML files in the channels directory
-    xml_files = [f for f in os.listdir(channels_dir) if f.endswith('.xml')]
+    xml_files = [e for e in os.scandir(channels_dir) if e.name.endswith('.xml') and e.is_file()]
     logger.info(f"Found {len(xml_files)} channel mapping files")
     
-    for xml_file in xml_files:
-        file_path = os.path.join(channels_dir, xml_file)
-        try:
-            # Parse the XML file
-            tree = ET.parse(file_path)
-            root = tree.getroot()
+    # Parse the files in worker processes, then merge in file order so later
+    # files still override earlier ones exactly as in a serial load
+    with ProcessPoolExecutor() as executor:
+        futures = [(xml_file, executor.submit(_parse_mapping_file, xml_file.path)) for xml_file in xml_files]
+        
+        for xml_file, future in futures:
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.error(f"Error loading channel mappings from {xml_file.path}: {e}")
+                continue
             
-            # Extract site name from filename (e.g., abc.com.channels.xml -> abc.com)
-            raw_site_name = xml_file.replace('.channels.xml', '')
-            site_name = clean_site_name(raw_site_name)
+            for channel_name, mapping_data in results:
+                # Create a key for the channel name (normalized for better matching)
+                mappings[channel_name] = mapping_data
+                normalized_mappings[normalize_channel_name(channel_name)] = mapping_data
             
-            # Process each channel element
-            channel_count = 0
-            for channel in root.findall('.//channel'):
-                site_id = channel.get('site_id', '')
-                xmltv_id = channel.get('xmltv_id', '')
-                lang = channel.get('lang', 'en')
-                channel_name = channel.text.strip() if channel.text else ''
-                
-                if site_id and channel_name:
-                    # Create a key for the channel name (normalized for better matching)
-                    normalized_name = normalize_channel_name(channel_name)
-                    
-                    # Store the mapping
-                    mapping_data = {
-                        'site': site_name,
-                        'site_id': site_id,
-                        'xmltv_id': xmltv_id,
-                        'lang': lang,
-                        'original_name': channel_name
-                    }
-                    
-                    mappings[channel_name] = mapping_data
-                    normalized_mappings[normalized_name] = mapping_data
-                    channel_count += 1
-            
-            logger.info(f"Loaded {channel_count} channel mappings from {xml_file}")
-        except Exception as e:
-            logger.error(f"Error loading channel mappings from {file_path}: {e}")
+            logger.info(f"Loaded {len(results)} channel mappings from {xml_file.name}")
     
     elapsed_time = time.time() - start_time
     logger.info(f"Loaded a total of {len(mappings)} channel mappings in {elapsed_time:.2f} seconds")
     return normalized_mappings
 
+@lru_cache(maxsize=65536)
 def normalize_channel_name(name):
     """Normalize channel name for better matching"""
     # Convert to uppercase
     name = name.upper()
     
     # Remove common suffixes
-    name = re.sub(r'\s+(HD|SD|FHD|UHD|4K|HEVC|H265|H\.265)\b', '', name)
-    name = re.sub(r'\s+(CHANNEL|TV|NETWORK)\s*$', '', name)
+    name = _RE_QUALITY.sub('', name)
+    name = _RE_SUFFIX.sub('', name)
     
     # Remove punctuation and standardize spacing
-    name = re.sub(r'[^\w\s]', ' ', name)
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = _RE_PUNCT.sub(' ', name)
+    name = _RE_WS.sub(' ', name).strip()
     
     return name
 
 def match_channels(playlist_channels, channel_mappings):
     """Match playlist channels with channel mappings using optimized approach"""
-    from concurrent.futures import ThreadPoolExecutor
-    
     logger.info(f"Starting channel matching process for {len(playlist_channels)} channels...")
     start_time = time.time()
     matches = []
@@ -254,11 +325,18 @@ def match_channels(playlist_channels, channel_mappings):
     logger.info("Normalizing channel names...")
     normalized_playlist_channels = []
     for channel in playlist_channels:
-        normalized_name = normalize_channel_name(channel['clean_name'])
+        normalized_name = normalize_channel_name(channel.clean_name)
         normalized_playlist_channels.append((channel, normalized_name))
     
-    # Create a list of all normalized mapping names for faster partial matching
-    mapping_names = list(channel_mappings.keys())
+    # Bucket normalized mapping names by first character for faster partial matching,
+    # each bucket sorted by name length so candidates can be cut down with bisect
+    mapping_buckets = defaultdict(list)
+    for index, mapping_name in enumerate(channel_mappings):
+        if mapping_name:
+            mapping_buckets[mapping_name[0]].append((len(mapping_name), index, mapping_name))
+    for bucket in mapping_buckets.values():
+        bucket.sort()
+    bucket_lengths = {first_char: [entry[0] for entry in bucket] for first_char, bucket in mapping_buckets.items()}
     
     # Function to process a single channel
     def process_channel(channel_data):
@@ -266,11 +344,7 @@ def match_channels(playlist_channels, channel_mappings):
         
         # Try direct match first (fastest)
         if normalized_name in channel_mappings:
-            return {
-                'playlist_channel': channel,
-                'mapping': channel_mappings[normalized_name],
-                'match_type': 'direct'
-            }
+            return Match(channel, channel_mappings[normalized_name], 'direct')
         
         # If no direct match, try partial matching
         best_match = None
@@ -279,41 +353,39 @@ def match_channels(playlist_channels, channel_mappings):
         # Only check partial matches for channels that share at least the first character
         # This significantly reduces the number of comparisons needed
         first_char = normalized_name[0] if normalized_name else ''
-        potential_matches = [name for name in mapping_names if name and name[0] == first_char]
+        potential_matches = []
+        if first_char in mapping_buckets:
+            # A similarity ratio of 2*M/(len1+len2) can only exceed 0.8 when the
+            # other name is between 2/3 and 3/2 of this one's length
+            length = len(normalized_name)
+            lengths = bucket_lengths[first_char]
+            lo = bisect_left(lengths, (2 * length + 2) // 3)
+            hi = bisect_right(lengths, (3 * length) // 2)
+            # Restore load order so ties resolve exactly as without pruning
+            potential_matches = [entry[2] for entry in sorted(mapping_buckets[first_char][lo:hi], key=itemgetter(1))]
         
-        for mapping_name in potential_matches:
-            # Calculate similarity score
-            score = calculate_similarity(normalized_name, mapping_name)
-            
-            if score > best_score and score > 0.8:  # 80% similarity threshold
-                best_score = score
-                best_match = channel_mappings[mapping_name]
+        # Score all candidates in a single C call (80% similarity threshold)
+        result = process.extractOne(normalized_name, potential_matches, scorer=fuzz.ratio, score_cutoff=80)
+        if result and result[1] > 80:
+            best_score = result[1] / 100
+            best_match = channel_mappings[result[0]]
         
         if best_match:
-            return {
-                'playlist_channel': channel,
-                'mapping': best_match,
-                'match_type': 'partial',
-                'score': best_score
-            }
+            return Match(channel, best_match, 'partial', best_score)
         else:
             # No match found
-            return {
-                'playlist_channel': channel,
-                'mapping': None,
-                'match_type': 'none'
-            }
-    
-    # Use ThreadPoolExecutor to process channels in parallel
-    max_workers = min(32, os.cpu_count() * 4)
-    logger.info(f"Processing matches using {max_workers} parallel workers...")
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        matches = list(executor.map(process_channel, normalized_playlist_channels))
-    
-    # Count matches
-    direct_matches = sum(1 for m in matches if m['match_type'] == 'direct')
-    partial_matches = sum(1 for m in matches if m['match_type'] == 'partial')
-    no_matches = sum(1 for m in matches if m['match_type'] == 'none')
+            return Match(channel, None, 'none')
+    
+    # Matching is CPU-bound and holds the GIL, so threads only add contention;
+    # rapidfuzz already does the heavy lifting in C
+    logger.info("Processing matches...")
+    matches = [process_channel(channel_data) for channel_data in normalized_playlist_channels]
+    
+    # Count matches in a single pass
+    match_counts = Counter(m.match_type for m in matches)
+    direct_matches = match_counts['direct']
+    partial_matches = match_counts['partial']
+    no_matches = match_counts['none']
     
     elapsed_time = time.time() - start_time
     logger.info(f"Matching completed in {elapsed_time:.2f} seconds")
@@ -321,20 +393,11 @@ def match_channels(playlist_channels, channel_mappings):
     
     return matches
 
-def calculate_similarity(str1, str2):
-    """Calculate similarity between two strings"""
-    # Simple implementation using difflib
-    from difflib import SequenceMatcher
-    return SequenceMatcher(None, str1, str2).ratio()
-
 def generate_channel_list_xml(matches, output_file, country_prefix=None):
     """Generate a channel list XML file from matches with each channel on a new line (optimized)"""
     logger.info(f"Generating channel list XML: {output_file}")
     start_time = time.time()
     
-    # Create the XML content directly as a string for better performance
-    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<channels>']
-    
     # Count matched channels and handle duplicate IDs
     matched_count = 0
     duplicate_count = 0
@@ -343,66 +406,66 @@ def generate_channel_list_xml(matches, output_file, country_prefix=None):
     id_count = {}  # Keep track of how many times we've seen each ID
     processed_channels = set()  # Track unique combinations of id+name to avoid exact duplicates
     
-    # Add channel elements for each match
-    for match in matches:
-        if match['mapping']:
-            channel = match['playlist_channel']
-            mapping = match['mapping']
-            
-            # Format the channel element as a string
-            site = mapping['site']
-            lang = mapping['lang']
-            xmltv_id = mapping['xmltv_id'] or channel['tvg_id'] or ''
-            site_id = mapping['site_id']
-            
-            # Set channel name with country prefix if specified
-            if country_prefix and not channel['name'].startswith(country_prefix):
-                channel_text = f"{country_prefix} {channel['name']}"
-            else:
-                channel_text = channel['name']
-            
-            # Create a unique identifier for this channel entry (ID + name)
-            channel_unique_key = f"{xmltv_id}::{channel_text}"
-            
-            # Skip if we've already added this exact ID + name combination
-            if channel_unique_key in processed_channels:
-                continue
-                
-            processed_channels.add(channel_unique_key)
-            
-            # Handle duplicate IDs by making them unique with a suffix
-            if xmltv_id in id_count:
-                # This is a duplicate ID
-                id_count[xmltv_id] += 1
-                duplicate_count += 1
-                # Add a suffix to create a unique ID
-                # But only if the names are different - we still want to deduplicate exact matches
-                xmltv_id_original = xmltv_id
-                xmltv_id = f"{xmltv_id}_{id_count[xmltv_id]}"
-                logger.debug(f"Created unique ID {xmltv_id} for duplicate channel (original ID: {xmltv_id_original}, name: {channel_text})")
-            else:
-                id_count[xmltv_id] = 0
-            
-            matched_count += 1
-            
-            # Escape special characters in attributes and text
-            site = escape_xml(site)
-            lang = escape_xml(lang)
-            xmltv_id = escape_xml(xmltv_id)
-            site_id = escape_xml(site_id)
-            channel_text = escape_xml(channel_text)
-            
-            # Create the channel element string
-            channel_line = f'  <channel site="{site}" lang="{lang}" xmltv_id="{xmltv_id}" site_id="{site_id}">{channel_text}</channel>'
-            lines.append(channel_line)
-    
-    # Close the root element
-    lines.append('</channels>')
-    
-    # Write to file
     try:
+        # Write each channel line straight to the file instead of building
+        # the whole document in memory first
         with open(output_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines))
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<channels>')
+            
+            # Add channel elements for each match
+            for match in matches:
+                if match.mapping:
+                    channel = match.playlist_channel
+                    mapping = match.mapping
+                    
+                    # Format the channel element as a string
+                    site = mapping['site']
+                    lang = mapping['lang']
+                    xmltv_id = mapping['xmltv_id'] or channel.tvg_id or ''
+                    site_id = mapping['site_id']
+                    
+                    # Set channel name with country prefix if specified
+                    if country_prefix and not channel.name.startswith(country_prefix):
+                        channel_text = f"{country_prefix} {channel.name}"
+                    else:
+                        channel_text = channel.name
+                    
+                    # Create a unique identifier for this channel entry (ID + name)
+                    channel_unique_key = f"{xmltv_id}::{channel_text}"
+                    
+                    # Skip if we've already added this exact ID + name combination
+                    if channel_unique_key in processed_channels:
+                        continue
+                    
+                    processed_channels.add(channel_unique_key)
+                    
+                    # Handle duplicate IDs by making them unique with a suffix
+                    if xmltv_id in id_count:
+                        # This is a duplicate ID
+                        id_count[xmltv_id] += 1
+                        duplicate_count += 1
+                        # Add a suffix to create a unique ID
+                        # But only if the names are different - we still want to deduplicate exact matches
+                        xmltv_id_original = xmltv_id
+                        xmltv_id = f"{xmltv_id}_{id_count[xmltv_id]}"
+                        logger.debug(f"Created unique ID {xmltv_id} for duplicate channel (original ID: {xmltv_id_original}, name: {channel_text})")
+                    else:
+                        id_count[xmltv_id] = 0
+                    
+                    matched_count += 1
+                    
+                    # Escape special characters in attributes and text
+                    site = escape_xml(site)
+                    lang = escape_xml(lang)
+                    xmltv_id = escape_xml(xmltv_id)
+                    site_id = escape_xml(site_id)
+                    channel_text = escape_xml(channel_text)
+                    
+                    # Write the channel element
+                    f.write(f'\n  <channel site="{site}" lang="{lang}" xmltv_id="{xmltv_id}" site_id="{site_id}">{channel_text}</channel>')
+            
+            # Close the root element
+            f.write('\n</channels>')
         
         elapsed_time = time.time() - start_time
         logger.info(f"Generated channel list XML with {matched_count} channels in {elapsed_time:.2f} seconds")
@@ -422,17 +485,9 @@ def escape_xml(text):
     if not isinstance(text, str):
         text = str(text)
     
-    # Replace special characters with their XML entities
-    text = text.replace('&', '&amp;')
-    text = text.replace('<', '&lt;')
-    text = text.replace('>', '&gt;')
-    text = text.replace('"', '&quot;')
-    text = text.replace("'", '&apos;')
-    
-    # Remove any control characters that are invalid in XML
-    text = ''.join(c for c in text if ord(c) >= 32 or c in '\n\r\t')
-    
-    return text
+    # Replace special characters with their XML entities and remove any
+    # control characters that are invalid in XML
+    return _RE_XML_INVALID.sub('', escape(text, _XML_QUOTE_ENTITIES))
 
 def validate_xml(file_path):
     """Validate XML file and log any issues"""
@@ -445,7 +500,7 @@ def validate_xml(file_path):
 
 def export_unmatched_channels(matches, output_file="unmatched_channels.log"):
     """Export unmatched channels to a log file"""
-    unmatched = [m['playlist_channel']['name'] for m in matches if m['match_type'] == 'none']
+    unmatched = [m.playlist_channel.name for m in matches if m.match_type == 'none']
     
     if not unmatched:
         logger.info("All channels were matched successfully")
@@ -458,8 +513,8 @@ def export_unmatched_channels(matches, output_file="unmatched_channels.log"):
         # Write unmatched channels to log file
         with open(output_file, 'w', encoding='utf-8') as f:
             f.write(f"# Unmatched channels ({len(unmatched)}) - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            for channel in sorted(unmatched):
-                f.write(f"{channel}\n")
+            unmatched.sort()
+            f.writelines(f"{channel}\n" for channel in unmatched)
         
         logger.info(f"Exported {len(unmatched)} unmatched channels to {output_file}")
     except Exception as e:
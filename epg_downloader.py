@@ -1,127 +1,279 @@
 #!/usr/bin/env python3
 import os
-import sys
+import argparse
+import logging
 import json
-import gzip
-import shutil
+import lzma
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # ISA-L's SIMD inflate is a drop-in replacement for zlib and much faster
+    from isal import isal_zlib as zlib
+except ImportError:
+    import zlib
+
+try:
+    import orjson
+except ImportError:
+    # Fall back to the json module in load_config
+    orjson = None
+
+# Configure logging (the handler serializes lines from the download threads)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger('epg_downloader')
 
 # Default configuration file
 DEFAULT_CONFIG_FILE = "epg_sources.json"
 # Default output directory
 DEFAULT_OUTPUT_DIR = "epg_data"
+# Maximum number of EPG files downloaded in parallel
+MAX_DOWNLOAD_WORKERS = 8
+# Buffer size for streaming copies (matches gzip's internal read size)
+COPY_BUFFER_SIZE = 128 * 1024
+# Write buffer for output files, so small decompressed chunks are batched
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Country code in a file name or URL: patterns like _UK_ or _IN1 anywhere take
+# priority, otherwise a uk/, in/, us/ directory right before the file name.
+# Anchored so the first alternative is tried over the whole string first, as
+# two separate searches would
+_RE_COUNTRY_CODE = re.compile(r'(?:.*?_([A-Z]{2})(?:_|[0-9])|.*/([a-z]{2})/[^/]+$)', re.DOTALL)
+
+# Connect and read timeouts (seconds) for EPG downloads
+DOWNLOAD_TIMEOUT = (5, 60)
+
+# Shared HTTP session so repeated downloads reuse pooled keep-alive connections,
+# retrying transient failures with a short backoff
+_SESSION = requests.Session()
+_RETRY = Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504))
+_SESSION.mount('https://', HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=_RETRY))
+_SESSION.mount('http://', HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=_RETRY))
+_SESSION.headers['User-Agent'] = 'home-epg/1.0'
 
 def load_config(config_file):
     """Load EPG source URLs from a JSON configuration file"""
     try:
         if not os.path.exists(config_file):
-            print(f"Error: Configuration file '{config_file}' not found.")
+            logger.error(f"Configuration file '{config_file}' not found.")
             return None
         
-        with open(config_file, 'r') as f:
-            config = json.load(f)
+        with open(config_file, 'rb') as f:
+            config = orjson.loads(f.read()) if orjson is not None else json.load(f)
         
         # Check if the config has the expected structure
         if "epg_sources" not in config:
-            print(f"Error: Configuration file '{config_file}' does not contain 'epg_sources' key.")
+            logger.error(f"Configuration file '{config_file}' does not contain 'epg_sources' key.")
             return None
         
         if not config["epg_sources"] or not isinstance(config["epg_sources"], list):
-            print(f"Error: No EPG sources found in '{config_file}'.")
+            logger.error(f"No EPG sources found in '{config_file}'.")
             return None
         
-        print(f"Loaded {len(config['epg_sources'])} EPG sources from '{config_file}'")
+        logger.info(f"Loaded {len(config['epg_sources'])} EPG sources from '{config_file}'")
         return config
-    except json.JSONDecodeError:
-        print(f"Error: '{config_file}' is not a valid JSON file.")
+    except ValueError:  # json and orjson decode errors both subclass ValueError
+        logger.error(f"'{config_file}' is not a valid JSON file.")
         return None
     except Exception as e:
-        print(f"Error loading configuration file: {e}")
+        logger.error(f"Error loading configuration file: {e}")
         return None
 
-def download_epg_file(url, output_dir):
-    """Download an EPG file from a URL and save it to the output directory"""
+def plan_epg_download(url, output_dir):
+    """Work out the local paths for an EPG URL: (url, download path, XML path, compression)"""
+    # Extract filename from URL
+    filename = os.path.basename(url)
+    if '?' in filename:  # Handle URLs with query parameters
+        filename = filename.split('?')[0]
+    
+    # If no filename could be extracted, create one based on the URL
+    if not filename:
+        filename = f"epg_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xml.gz"
+    
+    output_path = os.path.join(output_dir, filename)
+    # Compressed feeds are stored without their .gz/.xz extension
+    compression = os.path.splitext(filename)[1][1:]
+    if compression not in ('gz', 'xz'):
+        compression = None
+    xml_path = output_path[:-3] if compression else output_path
+    return url, output_path, xml_path, compression
+
+def download_epg_file(url, output_dir, plan=None):
+    """Download an EPG file from a URL and save it to the output directory, decompressing .gz/.xz files on the fly"""
     try:
         # Create the output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         
-        # Extract filename from URL
-        filename = os.path.basename(url)
-        if '?' in filename:  # Handle URLs with query parameters
-            filename = filename.split('?')[0]
+        _, output_path, cached_path, compression = plan or plan_epg_download(url, output_dir)
         
-        # If no filename could be extracted, create one based on the URL
-        if not filename:
-            filename = f"epg_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xml.gz"
+        # Ask the server to skip unchanged feeds, but only while we still
+        # have the XML from the previous download
+        validators_path = output_path + '.etag'
+        headers = {'Accept-Encoding': 'identity'}  # Keep .gz/.xz bodies as-is
+        if os.path.exists(validators_path) and os.path.exists(cached_path):
+            try:
+                with open(validators_path, 'r') as f:
+                    validators = json.load(f)
+                if validators.get('etag'):
+                    headers['If-None-Match'] = validators['etag']
+                if validators.get('last_modified'):
+                    headers['If-Modified-Since'] = validators['last_modified']
+            except (OSError, ValueError):
+                pass
         
-        output_path = os.path.join(output_dir, filename)
-        
-        print(f"Downloading {url}...")
-        response = requests.get(url, stream=True)
+        logger.info(f"Downloading {url}...")
+        response = _SESSION.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT, headers=headers)
+        if response.status_code == 304:
+            response.close()
+            logger.info(f"Not modified, using {cached_path}")
+            return cached_path
         response.raise_for_status()  # Raise an exception for HTTP errors
         
-        # Save the downloaded file
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        # Drop stale validators before overwriting the file they describe
+        if os.path.exists(validators_path):
+            os.remove(validators_path)
+        
+        if compression:
+            # Decompress straight from the response into the final XML
+            # instead of writing the archive to disk and reading it back
+            response.raw.decode_content = True  # Undo any transport encoding
+            decompress = decompress_stream if compression == 'gz' else decompress_xz_stream
+            with _atomic_output(cached_path) as f:
+                decompress(response.raw, f)
+                check_content_length(response, response.raw.tell())
+            output_path = cached_path
+        else:
+            # Save the downloaded file
+            bytes_written = 0
+            with _atomic_output(output_path) as f:
+                for chunk in response.iter_content(chunk_size=COPY_BUFFER_SIZE):
+                    f.write(chunk)
+                    bytes_written += len(chunk)
+                check_content_length(response, bytes_written)
         
-        print(f"Downloaded to {output_path}")
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            with open(validators_path, 'w') as f:
+                json.dump({'etag': etag, 'last_modified': last_modified}, f)
+        
+        logger.info(f"Downloaded to {output_path}")
         return output_path
     except requests.exceptions.RequestException as e:
-        print(f"Error downloading {url}: {e}")
+        logger.error(f"Error downloading {url}: {e}")
         return None
     except Exception as e:
-        print(f"Error downloading {url}: {e}")
+        logger.error(f"Error downloading {url}: {e}")
         return None
 
-def decompress_gz_file(gz_file_path, output_dir):
-    """Decompress a GZ file and save it to the output directory"""
+@contextmanager
+def _atomic_output(path):
+    """Write to a temporary file next to path and move it into place on success"""
+    # A crash or failed download never leaves a partial file at path
+    # for a later run to reuse as a cached copy
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
     try:
-        # Extract the base filename without the .gz extension
-        base_filename = os.path.basename(gz_file_path)
-        if base_filename.endswith('.gz'):
-            base_filename = base_filename[:-3]
-        
-        output_path = os.path.join(output_dir, base_filename)
-        
-        print(f"Decompressing {gz_file_path}...")
-        with gzip.open(gz_file_path, 'rb') as f_in:
-            with open(output_path, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
-        
-        print(f"Decompressed to {output_path}")
+        with open(tmp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def check_content_length(response, received):
+    """Raise if fewer or more bytes arrived than the server announced"""
+    expected = response.headers.get('Content-Length')
+    # With a content encoding the header counts encoded bytes, so skip the check
+    if expected and expected.isdigit() and 'Content-Encoding' not in response.headers:
+        if received != int(expected):
+            raise IOError(f"Incomplete download: received {received} of {expected} bytes")
+
+def decompress_stream(f_in, f_out):
+    """Decompress a gzip stream from one file object into another"""
+    # Decompress member by member so concatenated gzip streams are
+    # written out in full rather than stopping after the first one.
+    # In gzip mode zlib checks each member's CRC32/ISIZE trailer in C,
+    # so no second pass over the output is needed to verify it
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    
+    # Fail fast on HTML error pages and other bodies that are not gzip at all
+    magic = f_in.read(2)
+    if magic != b'\x1f\x8b':
+        raise ValueError("Not a gzip file (missing gzip magic bytes)")
+    f_out.write(decompressor.decompress(magic))
+    
+    # Read into one preallocated buffer instead of a new bytes per read
+    buf = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buf)
+    while True:
+        n = f_in.readinto(buf)
+        if not n:
+            break
         
-        # Remove the compressed file after successful decompression
-        os.remove(gz_file_path)
-        print(f"Removed compressed file: {gz_file_path}")
+        chunk = view[:n]
+        while chunk:
+            if decompressor.eof:
+                # Previous member finished; start the next one
+                # (skipping any zero padding between members)
+                chunk = bytes(chunk).lstrip(b'\x00')
+                if not chunk:
+                    break
+                decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+            f_out.write(decompressor.decompress(chunk))
+            chunk = decompressor.unused_data
+    
+    if not decompressor.eof:
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+
+def decompress_xz_stream(f_in, f_out):
+    """Decompress an xz stream from one file object into another"""
+    decompressor = lzma.LZMADecompressor()
+    
+    buf = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buf)
+    while True:
+        n = f_in.readinto(buf)
+        if not n:
+            break
         
-        return output_path
-    except Exception as e:
-        print(f"Error decompressing {gz_file_path}: {e}")
-        return None
+        chunk = view[:n]
+        while chunk:
+            if decompressor.eof:
+                # Concatenated streams, possibly separated by null padding
+                chunk = bytes(chunk).lstrip(b'\x00')
+                if not chunk:
+                    break
+                decompressor = lzma.LZMADecompressor()
+            f_out.write(decompressor.decompress(chunk))
+            chunk = decompressor.unused_data
+    
+    if not decompressor.eof:
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
 
 def extract_country_code(filename):
     """Extract country code from filename"""
-    # Look for patterns like _UK_, _IN_, etc.
-    match = re.search(r'_([A-Z]{2})(?:_|[0-9])', filename)
-    if match:
-        return match.group(1)
-    
-    # Try to extract from patterns like uk/, in/, us/ in the URL path
-    match = re.search(r'\/([a-z]{2})\/[^\/]+$', filename)
-    if match:
-        return match.group(1).upper()
-    
-    return None
+    match = _RE_COUNTRY_CODE.match(filename)
+    if not match:
+        return None
+    return match.group(1) or match.group(2).upper()
 
 def download_epgs(config_file=DEFAULT_CONFIG_FILE, output_dir=DEFAULT_OUTPUT_DIR):
     """Download EPG files from configured sources"""
     # Load configuration
     config = load_config(config_file)
     if not config:
-        print(f"Creating a default configuration file: {config_file}")
+        logger.info(f"Creating a default configuration file: {config_file}")
         config = {
             "epg_sources": [
             ]
@@ -129,78 +281,64 @@ def download_epgs(config_file=DEFAULT_CONFIG_FILE, output_dir=DEFAULT_OUTPUT_DIR
         try:
             with open(config_file, 'w') as f:
                 json.dump(config, f, indent=4)
-            print(f"Default configuration saved to {config_file}")
-            print("You can edit this file to add your own EPG sources.")
+            logger.info(f"Default configuration saved to {config_file}")
+            logger.info("You can edit this file to add your own EPG sources.")
         except Exception as e:
-            print(f"Error creating default configuration file: {e}")
+            logger.error(f"Error creating default configuration file: {e}")
             return []
     
     # Download and decompress EPG files
     epg_files = []
     country_files = {}
     
-    for url in config.get("epg_sources", []):
-        downloaded_file = download_epg_file(url, output_dir)
-        if not downloaded_file:
+    # Downloads are network-bound, so run them concurrently; each worker
+    # decompresses its file while streaming it
+    urls = config.get("epg_sources", [])
+    plans = [plan_epg_download(url, output_dir) for url in urls]
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_DOWNLOAD_WORKERS, len(urls)))) as executor:
+        futures = [executor.submit(download_epg_file, plan[0], output_dir, plan) for plan in plans]
+    
+    # Record the files in configuration order regardless of completion order
+    for url, future in zip(urls, futures):
+        epg_file = future.result()
+        if not epg_file:
             continue
-            
-        if downloaded_file.endswith('.gz'):
-            decompressed_file = decompress_gz_file(downloaded_file, output_dir)
-            if decompressed_file:
-                epg_files.append(decompressed_file)
-                
-                # Extract country code and organize files by country
-                country_code = extract_country_code(url) or extract_country_code(os.path.basename(decompressed_file))
-                if country_code:
-                    if country_code not in country_files:
-                        country_files[country_code] = []
-                    country_files[country_code].append(decompressed_file)
-        else:
-            epg_files.append(downloaded_file)
-            
-            # Extract country code and organize files by country
-            country_code = extract_country_code(url) or extract_country_code(os.path.basename(downloaded_file))
-            if country_code:
-                if country_code not in country_files:
-                    country_files[country_code] = []
-                country_files[country_code].append(downloaded_file)
+        
+        epg_files.append(epg_file)
+        
+        # Extract country code and organize files by country
+        country_code = extract_country_code(url) or extract_country_code(os.path.basename(epg_file))
+        if country_code:
+            if country_code not in country_files:
+                country_files[country_code] = []
+            country_files[country_code].append(epg_file)
     
     # Print summary
     if epg_files:
-        print("\nDownloaded EPG files:")
+        logger.info("Downloaded EPG files:")
         for file in epg_files:
-            print(f"  - {file}")
+            logger.info(f"  - {file}")
         
-        print("\nFiles by country:")
+        logger.info("Files by country:")
         for country, files in country_files.items():
-            print(f"  {country}: {len(files)} file(s)")
+            logger.info(f"  {country}: {len(files)} file(s)")
             for file in files:
-                print(f"    - {os.path.basename(file)}")
+                logger.info(f"    - {os.path.basename(file)}")
     else:
-        print("No EPG files were successfully downloaded.")
-        print("Please check your internet connection and the URLs in your configuration file.")
+        logger.warning("No EPG files were successfully downloaded.")
+        logger.warning("Please check your internet connection and the URLs in your configuration file.")
     
     return epg_files
 
 def main():
     # Parse command line arguments
-    config_file = DEFAULT_CONFIG_FILE
-    output_dir = DEFAULT_OUTPUT_DIR
-    
-    i = 1
-    while i < len(sys.argv):
-        arg = sys.argv[i]
-        if arg == "--config" and i + 1 < len(sys.argv):
-            config_file = sys.argv[i + 1]
-            i += 2
-        elif arg == "--output-dir" and i + 1 < len(sys.argv):
-            output_dir = sys.argv[i + 1]
-            i += 2
-        else:
-            i += 1
+    parser = argparse.ArgumentParser(description='Download and decompress EPG files from configured sources')
+    parser.add_argument('--config', default=DEFAULT_CONFIG_FILE, help=f'JSON file with EPG sources (default: {DEFAULT_CONFIG_FILE})')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help=f'Directory to save EPG files (default: {DEFAULT_OUTPUT_DIR})')
+    args = parser.parse_args()
     
     # Download EPG files
-    download_epgs(config_file, output_dir)
+    download_epgs(args.config, args.output_dir)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
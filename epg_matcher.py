@@ -3,46 +3,71 @@ import re
 import os
 import sys
 import csv
-import glob
-import xml.etree.ElementTree as ET
-from difflib import SequenceMatcher
 import time
+import json
+import shutil
 import requests
 import datetime
+import hashlib
+import pickle
+import tempfile
+from collections import Counter
+from copy import deepcopy
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
 try:
-    from fuzzywuzzy import fuzz
+    # libxml2 parses and serializes large XMLTV files much faster
+    from lxml import etree as ET
 except ImportError:
-    print("Warning: fuzzywuzzy package not found. Install with: pip install fuzzywuzzy python-Levenshtein")
-    # Define a simple fallback for fuzz functions
-    class FuzzFallback:
-        @staticmethod
-        def ratio(s1, s2):
-            return SequenceMatcher(None, s1, s2).ratio() * 100
-        
-        @staticmethod
-        def partial_ratio(s1, s2):
-            return SequenceMatcher(None, s1, s2).ratio() * 100
-        
-        @staticmethod
-        def token_sort_ratio(s1, s2):
-            return SequenceMatcher(None, s1, s2).ratio() * 100
-        
-        @staticmethod
-        def token_set_ratio(s1, s2):
-            return SequenceMatcher(None, s1, s2).ratio() * 100
-    
-    fuzz = FuzzFallback()
+    import xml.etree.ElementTree as ET
+try:
+    # RapidFuzz scores a name against every EPG name in one C call
+    import rapidfuzz
+    from rapidfuzz import fuzz, process
+except ImportError:
+    print("Error: rapidfuzz package not found. Install with: pip install rapidfuzz")
+    sys.exit(1)
+
+try:
+    # Lets match_channels score every playlist/EPG name pair with one cdist call per method
+    import numpy as np
+except ImportError:
+    np = None
+
+# Fuzzy matching methods, in the order they win ties
+FUZZY_METHODS = (
+    (fuzz.ratio, 'String similarity'),
+    (fuzz.partial_ratio, 'Partial match'),
+    (fuzz.token_sort_ratio, 'Token sort'),
+    (fuzz.token_set_ratio, 'Token set'),
+)
+# Upper bound on the number of scores held in memory per cdist call
+CDIST_BLOCK_SIZE = 1 << 22
 
 # Default output directory for filtered EPG files
 DEFAULT_OUTPUT_DIR = "export_epg"
 # Default directory where EPG files are stored
 DEFAULT_EPG_DIR = "epg_data"
+# Bump when the matching logic changes so stale cached matches are ignored
+MATCH_CACHE_VERSION = 3
+# Bump when load_epg_channels' output changes so stale cached channel lists are ignored
+EPG_CACHE_VERSION = 1
+# Below this many playlist channels, matching runs in-process
+MIN_PARALLEL_CHANNELS = 200
+# Per-directory record of ETag/Last-Modified values for downloaded playlists
+DOWNLOAD_META_FILE = '.meta.json'
+
+# Patterns for the channel name and tvg-id in an M3U #EXTINF line
+_RE_EXTINF_NAME = re.compile(r',(.+)$')
+_RE_TVG_ID = re.compile(r'tvg-id="([^"]*)"')
 
 def load_playlist_from_xml(xml_content):
     """Load channels from XML content that contains channel information"""
     try:
-        # Parse the XML content
+        # Parse the XML content (lxml only accepts an encoding declaration in bytes)
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode('utf-8')
         root = ET.fromstring(xml_content)
         
         channels = []
@@ -75,6 +100,57 @@ def load_playlist_from_xml(xml_content):
         print(f"Error parsing XML playlist: {e}")
         return []
 
+def _parse_m3u_lines(lines, country_prefix=None):
+    """Parse channels from an iterable of M3U lines"""
+    channels = []
+    # An included #EXTINF line waiting for its URL on the next line
+    pending = None
+    
+    # Get TV channels only
+    for line in lines:
+        line = line.rstrip('\n')
+        if pending is not None:
+            # Get the URL from the next line
+            if not line.startswith("#"):
+                channel_info, channel_name, clean_name = pending
+                url = line.strip()
+                # Extract tvg-id if available
+                tvg_id_match = _RE_TVG_ID.search(channel_info)
+                tvg_id = tvg_id_match.group(1) if tvg_id_match else ""
+                
+                channels.append({
+                    'name': channel_name,
+                    'clean_name': clean_name,
+                    'tvg_id': tvg_id,
+                    'info': channel_info,
+                    'url': url
+                })
+            pending = None
+        
+        if not line.startswith("#EXTINF"):
+            continue
+        # A channel name can only start with the prefix if the line contains it
+        if country_prefix and country_prefix not in line:
+            continue
+        
+        # Extract channel name
+        channel_name_match = _RE_EXTINF_NAME.search(line)
+        if channel_name_match:
+            channel_name = channel_name_match.group(1).strip()
+            
+            # Apply country filter if specified (only include channels that start with the prefix)
+            if country_prefix and not channel_name.startswith(country_prefix):
+                continue
+            
+            # Clean name (remove country prefix)
+            clean_name = channel_name
+            if country_prefix:
+                clean_name = channel_name[len(country_prefix):].strip()
+            
+            pending = (line, channel_name, clean_name)
+    
+    return channels
+
 def load_playlist_channels(file_path, country_prefix=None):
     """Load channels from M3U playlist file with optional country filtering"""
     if not os.path.exists(file_path):
@@ -83,12 +159,19 @@ def load_playlist_channels(file_path, country_prefix=None):
     
     print(f"Loading playlist from {file_path}...")
     try:
-        # Check if the file is XML
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+            # Check if the file is XML from its first few KB: if it starts with
+            # XML declaration or contains <tv> tag, treat as XML
+            head = f.read(4096)
+            is_xml = head.strip().startswith('<?xml') or '<tv>' in head
+            if is_xml:
+                content = head + f.read()
+            else:
+                # Otherwise, process as M3U straight from the file
+                f.seek(0)
+                channels = _parse_m3u_lines(f, country_prefix)
         
-        # If it starts with XML declaration or contains <tv> tag, treat as XML
-        if content.strip().startswith('<?xml') or '<tv>' in content:
+        if is_xml:
             print("Detected XML format in playlist file")
             channels = load_playlist_from_xml(content)
             
@@ -107,47 +190,6 @@ def load_playlist_channels(file_path, country_prefix=None):
             
             return channels
         
-        # Otherwise, process as M3U
-        channels = []
-        lines = content.splitlines()
-        
-        # Get TV channels only
-        for i in range(len(lines)):
-            if lines[i].startswith("#EXTINF"):
-                # Get the channel info from current line
-                channel_info = lines[i]
-                # Extract channel name
-                channel_name_match = re.search(r',(.+)$', channel_info)
-                if channel_name_match:
-                    channel_name = channel_name_match.group(1).strip()
-                    
-                    # Apply country filter if specified
-                    include_channel = True
-                    if country_prefix:
-                        # Only include channels that start with the prefix
-                        include_channel = channel_name.startswith(country_prefix)
-                    
-                    if include_channel:
-                        # Get the URL from the next line
-                        if i + 1 < len(lines) and not lines[i + 1].startswith("#"):
-                            url = lines[i + 1].strip()
-                            # Extract tvg-id if available
-                            tvg_id_match = re.search(r'tvg-id="([^"]*)"', channel_info)
-                            tvg_id = tvg_id_match.group(1) if tvg_id_match else ""
-                            
-                            # Clean name (remove country prefix)
-                            clean_name = channel_name
-                            if country_prefix and channel_name.startswith(country_prefix):
-                                clean_name = channel_name[len(country_prefix):].strip()
-                            
-                            channels.append({
-                                'name': channel_name,
-                                'clean_name': clean_name,
-                                'tvg_id': tvg_id,
-                                'info': channel_info,
-                                'url': url
-                            })
-        
         if country_prefix:
             print(f"Found {len(channels)} channels with prefix: {country_prefix}")
         else:
@@ -157,6 +199,27 @@ def load_playlist_channels(file_path, country_prefix=None):
         print(f"Error loading playlist: {e}")
         return []
 
+def _epg_channels_cache_path(epg_file):
+    """Return the path of the cached channel list for an EPG file"""
+    return os.path.join(os.path.dirname(os.path.abspath(epg_file)), '.cache', os.path.basename(epg_file) + '.channels.pkl')
+
+def _write_cache(cache_path, cache_key, value):
+    """Pickle a value with the key it was computed for, replacing the cache file atomically"""
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        # A unique temporary file keeps concurrent writers from clobbering each other
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((cache_key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except Exception as e:
+        print(f"Warning: could not write cache {cache_path}: {e}")
+
 def load_epg_channels(epg_file_path):
     """Load channel information from EPG XML file"""
     if not os.path.exists(epg_file_path):
@@ -164,166 +227,322 @@ def load_epg_channels(epg_file_path):
         return []
     
     print(f"Loading EPG data from {epg_file_path}...")
+    
+    # Reuse the channels parsed on a previous run if the file hasn't changed
+    cache_path = _epg_channels_cache_path(epg_file_path)
+    cache_key = None
+    try:
+        st = os.stat(epg_file_path)
+        cache_key = (EPG_CACHE_VERSION, st.st_mtime_ns, st.st_size)
+        with open(cache_path, 'rb') as f:
+            cached_key, cached_channels = pickle.load(f)
+        if cached_key == cache_key:
+            print(f"Loaded {len(cached_channels)} channels from cache {cache_path}")
+            return cached_channels
+    except Exception:
+        pass
+    
     try:
-        # Parse the XML file
-        tree = ET.parse(epg_file_path)
-        root = tree.getroot()
+        # Stream the file, dropping each element once seen so the
+        # programme listings are never held in memory
+        context = ET.iterparse(epg_file_path, events=('start', 'end'))
+        _, root = next(context)
         
         epg_channels = []
         
         # Extract channel information
-        for channel in root.findall(".//channel"):
-            channel_id = channel.get('id')
-            
-            # Get display names
-            display_names = []
-            for display_name in channel.findall(".//display-name"):
-                if display_name.text:
-                    display_names.append(display_name.text.strip())
-            
-            # Get icons
-            icons = []
-            for icon in channel.findall(".//icon"):
-                src = icon.get('src')
-                if src:
-                    icons.append(src)
+        for event, elem in context:
+            if event != 'end' or elem.tag not in ('channel', 'programme'):
+                continue
+            if elem.tag == 'channel':
+                channel = elem
+                channel_id = channel.get('id')
+                
+                # Get display names
+                display_names = []
+                for display_name in channel.iter('display-name'):
+                    if display_name.text:
+                        display_names.append(display_name.text.strip())
+                
+                # Get icons
+                icons = []
+                for icon in channel.iter('icon'):
+                    src = icon.get('src')
+                    if src:
+                        icons.append(src)
+                
+                if channel_id and display_names:
+                    epg_channels.append({
+                        'id': channel_id,
+                        'display_names': display_names,
+                        'primary_name': display_names[0] if display_names else "",
+                        'icons': icons
+                    })
             
-            if channel_id and display_names:
-                epg_channels.append({
-                    'id': channel_id,
-                    'display_names': display_names,
-                    'primary_name': display_names[0] if display_names else "",
-                    'icons': icons
-                })
+            root.clear()
         
         print(f"Loaded {len(epg_channels)} channels from EPG data")
+        if cache_key is not None:
+            _write_cache(cache_path, cache_key, epg_channels)
         return epg_channels
     except Exception as e:
         print(f"Error loading EPG file: {e}")
         return []
 
+# Patterns used by clean_channel_name, compiled once
+# (each country prefix can only be followed by the ones listed after it)
+_RE_PREFIX = re.compile(r'^(?:UK:\s*)?(?:US:\s*)?(?:IN:\s*)?(?:CA:\s*)?', re.IGNORECASE)
+_RE_SPACE = re.compile(r'\s+')
+_RE_QUALITY = re.compile(r'\b(HD|SD|FHD|UHD|4K|HEVC|H265|H\.265)\b', re.IGNORECASE)
+_RE_QUALITY_SUFFIX = re.compile(r'\s+(HD|SD|FHD|UHD|4K)$', re.IGNORECASE)
+_RE_SUFFIX = re.compile(r'\s+(CHANNEL|TV|NETWORK|INDIA)\s*$', re.IGNORECASE)
+_RE_PUNCT = re.compile(r'[^\w\s]')
+_AND_TABLE = str.maketrans({'&': ' AND ', '+': ' AND '})
+
+@lru_cache(maxsize=65536)
 def clean_channel_name(name):
     """Clean channel name for better matching"""
     # Remove common prefixes
-    for prefix in ["UK:", "US:", "IN:", "CA:"]:
-        if name.upper().startswith(prefix):
-            name = name[len(prefix):].strip()
+    name = _RE_PREFIX.sub('', name)
     
     # Standardize spacing
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = _RE_SPACE.sub(' ', name).strip()
     
     # Remove HD/SD/FHD/UHD quality indicators
-    name = re.sub(r'\b(HD|SD|FHD|UHD|4K|HEVC|H265|H\.265)\b', '', name, flags=re.IGNORECASE)
-    name = re.sub(r'\s+(HD|SD|FHD|UHD|4K)$', '', name, flags=re.IGNORECASE)
+    name = _RE_QUALITY.sub('', name)
+    name = _RE_QUALITY_SUFFIX.sub('', name)
     
     # Remove other common suffixes
-    name = re.sub(r'\s+(CHANNEL|TV|NETWORK|INDIA)\s*$', '', name, flags=re.IGNORECASE)
+    name = _RE_SUFFIX.sub('', name)
     
     # Remove common punctuation that might affect matching
-    name = re.sub(r'[&+]', ' AND ', name)
-    name = re.sub(r'[^\w\s]', ' ', name)
+    name = name.translate(_AND_TABLE)
+    name = _RE_PUNCT.sub(' ', name)
     
     # Standardize spacing again after all replacements
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = _RE_SPACE.sub(' ', name).strip()
     
     return name.strip().upper()
 
-def find_best_match(channel, epg_channels, threshold=70, quiet=True):
+def build_epg_name_index(epg_channels):
+    """Clean every EPG display name once for find_best_match"""
+    names = []
+    entries = []
+    exact = {}
+    for epg_channel in epg_channels:
+        for display_name in epg_channel['display_names']:
+            clean_epg_name = clean_channel_name(display_name)
+            names.append(clean_epg_name)
+            entries.append((epg_channel, display_name))
+            # Keep the first channel with each name, as the exact match
+            exact.setdefault(clean_epg_name, (epg_channel, display_name))
+    return names, entries, exact
+
+def find_best_match(channel, epg_channels, threshold=70, quiet=True, epg_index=None):
     """Find the best matching EPG channel for a given playlist channel"""
     clean_name = clean_channel_name(channel['clean_name'])
-    best_match = None
-    best_score = 0
-    best_method = None
+    names, entries, exact = epg_index or build_epg_name_index(epg_channels)
     
     # For debugging
     if not quiet:
         print(f"Finding match for: {channel['name']} → Cleaned to: {clean_name}")
     
     # Try exact match first (case insensitive)
-    for epg_channel in epg_channels:
-        for display_name in epg_channel['display_names']:
-            clean_epg_name = clean_channel_name(display_name)
-            if clean_name == clean_epg_name:
-                if not quiet:
-                    print(f"  Exact match found: {display_name} ({epg_channel['id']})")
-                return {
-                    'epg_channel': epg_channel,
-                    'score': 100,
-                    'method': 'Exact match'
-                }
-    
-    # Try fuzzy matching
-    for epg_channel in epg_channels:
-        for display_name in epg_channel['display_names']:
-            clean_epg_name = clean_channel_name(display_name)
-            
-            # Try different fuzzy matching methods
-            ratio = fuzz.ratio(clean_name, clean_epg_name)
-            partial_ratio = fuzz.partial_ratio(clean_name, clean_epg_name)
-            token_sort_ratio = fuzz.token_sort_ratio(clean_name, clean_epg_name)
-            token_set_ratio = fuzz.token_set_ratio(clean_name, clean_epg_name)
-            
-            # Use the best score from any method
-            current_best = best_score
-            
-            if ratio > best_score:
-                best_score = ratio
-                best_match = epg_channel
-                best_method = 'String similarity'
-            
-            if partial_ratio > best_score:
-                best_score = partial_ratio
-                best_match = epg_channel
-                best_method = 'Partial match'
-            
-            if token_sort_ratio > best_score:
-                best_score = token_sort_ratio
-                best_match = epg_channel
-                best_method = 'Token sort'
-                
-            if token_set_ratio > best_score:
-                best_score = token_set_ratio
-                best_match = epg_channel
-                best_method = 'Token set'
-                
-            # Print high-scoring matches for debugging
-            if not quiet and best_score > current_best and best_score >= 80:
-                print(f"  Good match: {display_name} - Score: {best_score}% ({best_method})")
+    if clean_name in exact:
+        epg_channel, display_name = exact[clean_name]
+        if not quiet:
+            print(f"  Exact match found: {display_name} ({epg_channel['id']})")
+        return {
+            'epg_channel': epg_channel,
+            'score': 100,
+            'method': 'Exact match'
+        }
     
-    if best_score >= threshold:
+    # Try fuzzy matching: score every EPG name with each method in one
+    # call. Each method picks the EPG name with the highest unrounded score;
+    # when methods tie on the rounded score, the earlier EPG name and then
+    # the earlier method wins
+    best_score = 0
+    best_index = None
+    best_method = None
+    for scorer, method in FUZZY_METHODS:
+        # Nothing beats a perfect score, so later methods can only win the
+        # tie with an earlier EPG name
+        choices = names
+        if best_score >= 100:
+            if best_index == 0:
+                break
+            choices = names[:best_index]
+        # Scores are rounded to whole percentages, so anything that rounds up
+        # to the threshold (or ties the best score so far) still counts; the
+        # rising cutoff lets later methods abandon weaker names early
+        result = process.extractOne(clean_name, choices, scorer=scorer,
+                                    score_cutoff=max(0, threshold - 0.5, best_score - 0.5))
+        if result is None:
+            continue
+        score, index = round(result[1]), result[2]
+        if best_index is None or score > best_score or (score == best_score and index < best_index):
+            best_score, best_index, best_method = score, index, method
+    
+    if best_index is not None and best_score >= threshold:
+        epg_channel, display_name = entries[best_index]
+        if not quiet:
+            print(f"  Best match: {display_name} - Score: {best_score}% ({best_method})")
         return {
-            'epg_channel': best_match,
+            'epg_channel': epg_channel,
             'score': best_score,
             'method': best_method
         }
     else:
         if not quiet:
-            print(f"  No good match found. Best score: {best_score}%")
+            print("  No good match found.")
         return None
 
+def find_best_matches(playlist_channels, epg_channels, threshold=70, epg_index=None):
+    """Find the best matching EPG channel for every playlist channel at once"""
+    epg_index = epg_index or build_epg_name_index(epg_channels)
+    names, entries, exact = epg_index
+    # cdist pays off by scoring on every core; on a single core the
+    # per-name extractOne prunes more work with its rising score cutoff
+    if np is None or not names or (os.cpu_count() or 1) < 2:
+        return [find_best_match(channel, epg_channels, threshold, True, epg_index) for channel in playlist_channels]
+    
+    epg_matches = [None] * len(playlist_channels)
+    fuzzy_rows = []
+    queries = []
+    for row, channel in enumerate(playlist_channels):
+        clean_name = clean_channel_name(channel['clean_name'])
+        if clean_name in exact:
+            epg_matches[row] = {
+                'epg_channel': exact[clean_name][0],
+                'score': 100,
+                'method': 'Exact match'
+            }
+        else:
+            fuzzy_rows.append(row)
+            queries.append(clean_name)
+    
+    # Score blocks of playlist names against all EPG names, with the same
+    # tie-breaking as find_best_match: each method picks the highest
+    # unrounded score, and methods tying on the rounded score resolve to
+    # the earlier EPG name, then the earlier method
+    block = max(1, CDIST_BLOCK_SIZE // len(names))
+    for start in range(0, len(queries), block):
+        block_queries = queries[start:start + block]
+        rows = np.arange(len(block_queries))
+        best_score = np.zeros(len(block_queries))
+        best_index = np.full(len(block_queries), len(names))
+        best_method = np.zeros(len(block_queries), dtype=np.intp)
+        for order, (scorer, method) in enumerate(FUZZY_METHODS):
+            scores = process.cdist(block_queries, names, scorer=scorer,
+                                   score_cutoff=max(0, threshold - 0.5), workers=-1)
+            index = scores.argmax(axis=1)
+            score = np.round(scores[rows, index])
+            better = (score > best_score) | ((score == best_score) & (index < best_index))
+            best_score = np.where(better, score, best_score)
+            best_index = np.where(better, index, best_index)
+            best_method = np.where(better, order, best_method)
+        
+        for row, score, index, order in zip(fuzzy_rows[start:start + block], best_score.tolist(),
+                                            best_index.tolist(), best_method.tolist()):
+            if score >= threshold:
+                epg_matches[row] = {
+                    'epg_channel': entries[index][0],
+                    'score': int(score),
+                    'method': FUZZY_METHODS[order][1]
+                }
+    
+    return epg_matches
+
+# EPG channels, their name index and threshold shared by the match worker processes
+_worker_epg_channels = None
+_worker_epg_index = None
+_worker_threshold = None
+
+def _init_match_worker(epg_channels, threshold):
+    """Store the EPG channels once per worker process"""
+    global _worker_epg_channels, _worker_epg_index, _worker_threshold
+    _worker_epg_channels = epg_channels
+    _worker_epg_index = build_epg_name_index(epg_channels)
+    _worker_threshold = threshold
+
+def _match_chunk(channels):
+    """Find the best EPG match for each channel in a chunk of the playlist"""
+    return [find_best_match(channel, _worker_epg_channels, _worker_threshold, epg_index=_worker_epg_index) for channel in channels]
+
+def _match_cache_path(epg_file):
+    """Return the path of the cached match results for an EPG file"""
+    return os.path.join(os.path.dirname(os.path.abspath(epg_file)), '.cache', os.path.basename(epg_file) + '.matches.pkl')
+
+def _match_cache_key(playlist_channels, epg_file, threshold):
+    """Build a key identifying the inputs that determine the match results"""
+    st = os.stat(epg_file)
+    names = hashlib.sha1(repr([c['clean_name'] for c in playlist_channels]).encode('utf-8')).hexdigest()
+    return (MATCH_CACHE_VERSION, names, st.st_mtime_ns, st.st_size, threshold, rapidfuzz.__version__)
+
 def match_channels(playlist_channels, epg_file, threshold=70, quiet=True):
     """Match playlist channels with EPG data"""
-    epg_channels = load_epg_channels(epg_file)
-    if not epg_channels:
-        return []
+    # Reuse the previous results if neither the playlist names nor the EPG file changed
+    cache_path = _match_cache_path(epg_file)
+    cache_key = None
+    epg_matches = None
+    try:
+        cache_key = _match_cache_key(playlist_channels, epg_file, threshold)
+        with open(cache_path, 'rb') as f:
+            cached_key, cached_matches = pickle.load(f)
+        if cached_key == cache_key:
+            epg_matches = cached_matches
+            print(f"Using cached matches from {cache_path}")
+    except Exception:
+        pass
+    
+    if epg_matches is None:
+        epg_channels = load_epg_channels(epg_file)
+        if not epg_channels:
+            return []
+        
+        workers = os.cpu_count() or 1
+        if quiet and workers > 1 and np is not None:
+            # cdist already spreads the scoring over all cores
+            epg_matches = find_best_matches(playlist_channels, epg_channels, threshold)
+        elif quiet and workers > 1 and len(playlist_channels) >= MIN_PARALLEL_CHANNELS:
+            # Fuzzy matching is CPU-bound, so spread the playlist over worker
+            # processes; each worker receives the EPG channels once at startup
+            chunk_size = max(1, -(-len(playlist_channels) // (workers * 4)))
+            chunks = [playlist_channels[i:i + chunk_size] for i in range(0, len(playlist_channels), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_match_worker,
+                                     initargs=(epg_channels, threshold)) as executor:
+                epg_matches = [m for chunk_matches in executor.map(_match_chunk, chunks) for m in chunk_matches]
+        else:
+            # Verbose output would interleave across processes, so keep it serial
+            epg_index = build_epg_name_index(epg_channels)
+            epg_matches = [find_best_match(channel, epg_channels, threshold, quiet, epg_index) for channel in playlist_channels]
+        
+        if cache_key is not None:
+            _write_cache(cache_path, cache_key, epg_matches)
     
-    matches = []
-    for channel in playlist_channels:
-        epg_match = find_best_match(channel, epg_channels, threshold, quiet)
-        matches.append({
-            'playlist_channel': channel,
-            'epg_match': epg_match
-        })
+    matches = [{'playlist_channel': channel, 'epg_match': epg_match}
+               for channel, epg_match in zip(playlist_channels, epg_matches)]
     
-    # Count matches
-    matched_count = sum(1 for m in matches if m['epg_match'])
-    perfect_matches = sum(1 for m in matches if m['epg_match'] and m['epg_match']['score'] == 100)
+    # Count matches and perfect matches in a single pass
+    matched_count = perfect_matches = 0
+    for epg_match in epg_matches:
+        if epg_match:
+            matched_count += 1
+            if epg_match['score'] == 100:
+                perfect_matches += 1
     
     print(f"Found matches for {matched_count} out of {len(playlist_channels)} channels ({matched_count/len(playlist_channels)*100:.1f}%)")
     print(f"Perfect matches (100% score): {perfect_matches}")
     
     return matches
 
+def _tv_start_tag(attrib):
+    """Serialize an open <tv> tag with the given attributes"""
+    # Let the serializer escape the attributes, then turn the empty
+    # element it produces into an open tag
+    return ET.tostring(ET.Element('tv', attrib), encoding='utf-8').rstrip(b'/>').rstrip() + b'>'
+
 def generate_filtered_epg_xml(matches, input_epg_file, output_file, only_perfect=True):
     """Generate a filtered EPG XML file containing only matched channels and their programs"""
     if not os.path.exists(input_epg_file):
@@ -341,70 +560,72 @@ def generate_filtered_epg_xml(matches, input_epg_file, output_file, only_perfect
         return False
     
     try:
-        # Parse the original EPG file
-        tree = ET.parse(input_epg_file)
-        root = tree.getroot()
-        
-        # Create a new XML root with the same structure
-        new_root = ET.Element('tv')
-        for attr_name, attr_value in root.attrib.items():
-            new_root.set(attr_name, attr_value)
-        
         # Track channel IDs to include (for programs), but still allow duplicate channels
-        channel_ids_to_include = set()
-        channel_count = 0
-        
-        # Add matched channels to the new XML
-        for match in matches_to_include:
-            epg_channel_id = match['epg_match']['epg_channel']['id']
-            channel_ids_to_include.add(epg_channel_id)
-            
-            # Find the original channel template (we'll use just the first one as template)
-            channel_template = root.find(".//channel[@id='{}']".format(epg_channel_id))
-            if not channel_template:
+        channel_ids_to_include = frozenset(match['epg_match']['epg_channel']['id'] for match in matches_to_include)
+        
+        # First pass: stream the file, keeping the first channel element for
+        # each matched ID as its template
+        channel_templates = {}
+        context = ET.iterparse(input_epg_file, events=('start', 'end'))
+        _, root = next(context)
+        tv_attrib = dict(root.attrib)
+        for event, elem in context:
+            if event != 'end' or elem.tag not in ('channel', 'programme'):
                 continue
-            
-            # Create a new channel element
-            new_channel = ET.SubElement(new_root, 'channel', id=epg_channel_id)
-            channel_count += 1
-            
-            # Use the playlist channel name as the display name
-            display_name = ET.SubElement(new_channel, 'display-name')
-            display_name.text = match['playlist_channel']['name']
-            
-            # Copy icons if they exist
-            for icon in channel_template.findall('.//icon'):
-                new_icon = ET.SubElement(new_channel, 'icon', src=icon.get('src', ''))
-            
-            # Copy any other elements
-            for child in channel_template:
-                if child.tag != 'display-name' and child.tag != 'icon':
-                    new_channel.append(child)
-        
-        # Add program entries for the included channels
-        for program in root.findall(".//programme"):
-            channel_id = program.get('channel')
-            if channel_id in channel_ids_to_include:
-                # Copy the program element and all its children
-                new_program = ET.Element('programme')
-                for attr_name, attr_value in program.attrib.items():
-                    new_program.set(attr_name, attr_value)
-                
-                for child in program:
-                    new_program.append(child)
-                
-                new_root.append(new_program)
-        
-        # Create a new XML tree and write to file
-        new_tree = ET.ElementTree(new_root)
-        
-        # Count the number of programs included
-        program_count = len(new_root.findall(".//programme"))
+            if elem.tag == 'channel' and elem.get('id') in channel_ids_to_include:
+                channel_templates.setdefault(elem.get('id'), elem)
+            root.clear()
         
-        # Write the new XML file with proper formatting
         with open(output_file, 'wb') as f:
             f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
-            new_tree.write(f, encoding='utf-8')
+            f.write(_tv_start_tag(tv_attrib))
+            
+            # Add matched channels to the new XML
+            channel_count = 0
+            for match in matches_to_include:
+                epg_channel_id = match['epg_match']['epg_channel']['id']
+                
+                # Find the original channel template (we'll use just the first one as template)
+                channel_template = channel_templates.get(epg_channel_id)
+                if channel_template is None or not len(channel_template):
+                    continue
+                
+                # Create a new channel element
+                new_channel = ET.Element('channel', id=epg_channel_id)
+                channel_count += 1
+                
+                # Use the playlist channel name as the display name
+                display_name = ET.SubElement(new_channel, 'display-name')
+                display_name.text = match['playlist_channel']['name']
+                
+                # Copy icons if they exist
+                for icon in channel_template.findall('.//icon'):
+                    new_icon = ET.SubElement(new_channel, 'icon', src=icon.get('src', ''))
+                
+                # Copy any other elements (lxml would move the originals out of the source)
+                for child in channel_template:
+                    if child.tag != 'display-name' and child.tag != 'icon':
+                        new_channel.append(deepcopy(child))
+                
+                f.write(ET.tostring(new_channel, encoding='utf-8'))
+            
+            # Second pass: stream program entries for the included channels
+            # straight to the output
+            program_count = 0
+            context = ET.iterparse(input_epg_file, events=('start', 'end'))
+            _, root = next(context)
+            for event, elem in context:
+                if event != 'end' or elem.tag not in ('channel', 'programme'):
+                    continue
+                if elem.tag == 'programme' and elem.get('channel') in channel_ids_to_include:
+                    # Copy the program element and all its children
+                    new_program = ET.Element('programme', elem.attrib)
+                    new_program.extend(list(elem))
+                    f.write(ET.tostring(new_program, encoding='utf-8'))
+                    program_count += 1
+                root.clear()
+            
+            f.write(b'</tv>')
         
         print(f"Generated filtered EPG file: {output_file}")
         print(f"Included {channel_count} channels and {program_count} program entries")
@@ -425,63 +646,64 @@ def consolidate_epg_files(epg_files, output_file):
         return epg_files[0]
     
     try:
-        # Create a new XML root
-        new_root = ET.Element('tv')
-        new_root.set('generator-info-name', 'Consolidated EPG Generator')
-        
         # Modified: Track channel IDs for reference, but don't use for exclusion
-        channel_ids_count = {}
+        channel_ids_count = Counter()
         program_count = 0
+        # Overlapping sources carry the same programme more than once
+        seen_programs = set()
+        duplicate_programs = 0
         
         print(f"Consolidating {len(epg_files)} EPG files...")
         
-        for file_path in epg_files:
-            print(f"Processing {file_path}...")
-            
-            # Parse the EPG file
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            
-            # Copy attributes from the first file
-            if not new_root.attrib:
-                for attr, value in root.attrib.items():
-                    if attr != 'generator-info-name':
-                        new_root.set(attr, value)
-            
-            # Modified: Add all channels, even with duplicate IDs
-            for channel in root.findall(".//channel"):
-                channel_id = channel.get('id')
-                # Instead of skipping, we keep a count for reporting
-                if channel_id in channel_ids_count:
-                    channel_ids_count[channel_id] += 1
-                else:
-                    channel_ids_count[channel_id] = 1
-                
-                # Always add the channel
-                new_root.append(channel)
-            
-            # Add all programs
-            for program in root.findall(".//programme"):
-                new_root.append(program)
-                program_count += 1
-        
-        # Create a new XML tree
-        new_tree = ET.ElementTree(new_root)
-        
         # Create output directory if it doesn't exist
         os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
         
-        # Write the consolidated EPG file
+        # Stream every channel and programme of each file straight into the
+        # consolidated EPG file, clearing each one once written
         with open(output_file, 'wb') as f:
             f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
-            new_tree.write(f, encoding='utf-8')
+            f.write(_tv_start_tag({'generator-info-name': 'Consolidated EPG Generator'}) + b'\n')
+            
+            for file_path in epg_files:
+                print(f"Processing {file_path}...")
+                
+                context = ET.iterparse(file_path, events=('start', 'end'))
+                _, root = next(context)
+                for event, elem in context:
+                    if event != 'end' or elem.tag not in ('channel', 'programme'):
+                        continue
+                    if elem.tag == 'channel':
+                        # Modified: Add all channels, even with duplicate IDs
+                        # (instead of skipping, we keep a count for reporting)
+                        channel_ids_count[elem.get('id')] += 1
+                    else:
+                        # Ids and times repeat across many programmes, so intern
+                        # them to keep one copy of each string in the seen set
+                        key = (sys.intern(elem.get('channel') or ''),
+                               sys.intern(elem.get('start') or ''),
+                               sys.intern(elem.get('stop') or ''))
+                        if key in seen_programs:
+                            duplicate_programs += 1
+                            root.clear()
+                            continue
+                        seen_programs.add(key)
+                        program_count += 1
+                    # Whatever follows the element may not be parsed yet, so
+                    # give each one its own line rather than a partial tail
+                    elem.tail = '\n'
+                    f.write(ET.tostring(elem, encoding='utf-8'))
+                    root.clear()
+            
+            f.write(b'</tv>')
         
         unique_ids = len(channel_ids_count)
-        total_channels = sum(channel_ids_count.values())
+        total_channels = channel_ids_count.total()
         duplicate_count = total_channels - unique_ids
         
         print(f"Consolidated EPG file created: {output_file}")
         print(f"Included {total_channels} total channels ({unique_ids} unique IDs, {duplicate_count} duplicates) and {program_count} program entries")
+        if duplicate_programs:
+            print(f"Skipped {duplicate_programs} duplicate program entries")
         
         return output_file
     except Exception as e:
@@ -493,18 +715,18 @@ def find_epg_files_for_country(epg_dir, country_code):
     if not country_code:
         return []
     
-    # Look for files with the country code in the filename
-    pattern = os.path.join(epg_dir, f"*_{country_code}_*.xml")
-    files = glob.glob(pattern)
-    
-    # Also try alternative pattern
-    alt_pattern = os.path.join(epg_dir, f"*_{country_code}[0-9]*.xml")
-    files.extend(glob.glob(alt_pattern))
-    
-    # Remove duplicates
-    files = list(set(files))
+    # Look for files with the country code in the filename (e.g. *_UK_*.xml
+    # or *_UK1*.xml), listing the directory once instead of globbing twice
+    pattern = re.compile(rf'.*_{re.escape(country_code)}(?:_|[0-9]).*\.xml', re.DOTALL)
+    try:
+        with os.scandir(epg_dir) as entries:
+            files = [entry.path for entry in entries
+                     if not entry.name.startswith('.') and pattern.fullmatch(entry.name) and entry.is_file()]
+    except OSError:
+        return []
     
-    return files
+    # Sort so consolidation order is stable between runs
+    return sorted(files)
 
 def extract_country_from_prefix(prefix):
     """Extract country code from a prefix like 'UK:', 'US:', etc."""
@@ -576,6 +798,23 @@ def match_epg_for_country(playlist_file, country_prefix, epg_dir=DEFAULT_EPG_DIR
     
     return success
 
+def _load_download_meta(output_dir):
+    """Load the ETag/Last-Modified values recorded for previous downloads"""
+    try:
+        with open(os.path.join(output_dir, DOWNLOAD_META_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_download_meta(output_dir, url, etag, last_modified, **extra):
+    """Record the validators of a completed download"""
+    meta = _load_download_meta(output_dir)
+    meta[url] = {'etag': etag, 'last_modified': last_modified, **extra}
+    meta_path = os.path.join(output_dir, DOWNLOAD_META_FILE)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_path + '.tmp', meta_path)
+
 def download_playlist_from_url(url, output_dir="playlist_data", force_download=False):
     """Download M3U playlist from a specified URL, with date in filename and only if needed"""
     try:
@@ -594,55 +833,47 @@ def download_playlist_from_url(url, output_dir="playlist_data", force_download=F
             print(f"Using existing playlist file from today: {output_path}")
             return output_path, 'm3u'
         
-        # Check for older files
-        if not force_download:
-            files = os.listdir(output_dir)
-            playlist_files = [f for f in files if f.startswith("playlist_") and f.endswith(".m3u")]
-            
-            if playlist_files:
-                # Sort by date (newest first)
-                playlist_files.sort(reverse=True)
-                newest_file = playlist_files[0]
-                newest_path = os.path.join(output_dir, newest_file)
-                
-                # Extract date from filename
-                try:
-                    file_date_str = newest_file.replace("playlist_", "").replace(".m3u", "")
-                    file_date = datetime.datetime.strptime(file_date_str, "%Y%m%d")
-                    
-                    # Check if file is less than one day old
-                    age = datetime.datetime.now() - file_date
-                    if age.days < 1:
-                        print(f"Using recent playlist file (less than 1 day old): {newest_path}")
-                        return newest_path, 'm3u'
-                    else:
-                        print(f"Existing playlist file is {age.days} days old. Downloading new one.")
-                except ValueError:
-                    # If we can't parse the date, download a new file
-                    pass
+        # Send the validators from the last download so an unchanged playlist
+        # costs a 304 instead of a full transfer
+        headers = {}
+        meta = _load_download_meta(output_dir).get(url, {})
+        previous_path = meta.get('path')
+        if not force_download and previous_path and os.path.exists(previous_path):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
         
         print(f"Downloading playlist from {url}...")
         
-        # Use requests to download the file
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        # Save the content to a file
-        with open(output_path, 'wb') as f:
-            f.write(response.content)
+        # Stream the body to disk rather than holding it all in memory
+        with requests.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                print(f"Playlist not modified, using {previous_path}")
+                return previous_path, meta.get('format', 'm3u')
+            response.raise_for_status()  # Raise an exception for HTTP errors
+            
+            response.raw.decode_content = True
+            with open(output_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
         
         print(f"Downloaded to {output_path}")
         
-        # Check if the content is XML by decoding a copy of the content
-        content_text = response.content.decode('utf-8', errors='ignore')
+        # Check if the content is XML from the start of the file
+        with open(output_path, 'r', encoding='utf-8', errors='ignore') as f:
+            content_text = f.read(4096)
+        file_format = 'm3u'
         if content_text.strip().startswith('<?xml') or '<tv>' in content_text:
             print("Detected XML format in playlist file")
             # If it's XML, rename the file to reflect that
             xml_path = output_path.replace(".m3u", ".xml")
-            os.rename(output_path, xml_path)
-            return xml_path, 'xml'
+            os.replace(output_path, xml_path)
+            output_path, file_format = xml_path, 'xml'
         
-        return output_path, 'm3u'
+        _save_download_meta(output_dir, url, etag, last_modified, path=output_path, format=file_format)
+        return output_path, file_format
     except Exception as e:
         print(f"Error downloading playlist from {url}: {e}")
         return None, None
@@ -3,37 +3,126 @@ import re
 import os
 import sys
 import csv
-import xml.etree.ElementTree as ET
-from difflib import SequenceMatcher
+import argparse
 import time
+import json
+import pickle
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from copy import deepcopy
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 try:
-    from fuzzywuzzy import fuzz
+    # ISA-L's SIMD inflate is a drop-in replacement for the gzip module
+    from isal import igzip as gzip
 except ImportError:
-    print("Warning: fuzzywuzzy package not found. Install with: pip install fuzzywuzzy python-Levenshtein")
-    # Define a simple fallback for fuzz functions
-    class FuzzFallback:
-        @staticmethod
-        def ratio(s1, s2):
-            return SequenceMatcher(None, s1, s2).ratio() * 100
-        
-        @staticmethod
-        def partial_ratio(s1, s2):
-            return SequenceMatcher(None, s1, s2).ratio() * 100
-        
-        @staticmethod
-        def token_sort_ratio(s1, s2):
-            return SequenceMatcher(None, s1, s2).ratio() * 100
-        
-        @staticmethod
-        def token_set_ratio(s1, s2):
-            return SequenceMatcher(None, s1, s2).ratio() * 100
-    
-    fuzz = FuzzFallback()
+    import gzip
+try:
+    # libxml2 parses and serializes large XMLTV files much faster
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+try:
+    # RapidFuzz scores a name against every EPG name in one C call
+    from rapidfuzz import fuzz, process
+except ImportError:
+    print("Error: rapidfuzz package not found. Install with: pip install rapidfuzz")
+    sys.exit(1)
+
+try:
+    # Lets match_channels score every playlist/EPG name pair with one cdist call per method
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import orjson
+except ImportError:
+    # Fall back to the json module in load_epg_sources
+    orjson = None
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    # Only needed for downloads; matching local files works without it
+    requests = None
+
+# Fuzzy matching methods, in the order they win ties
+FUZZY_METHODS = (
+    (fuzz.ratio, 'String similarity'),
+    (fuzz.partial_ratio, 'Partial match'),
+    (fuzz.token_sort_ratio, 'Token sort'),
+    (fuzz.token_set_ratio, 'Token set'),
+)
+# Upper bound on the number of scores held in memory per cdist call
+CDIST_BLOCK_SIZE = 1 << 22
+# Below this many playlist channels, matching runs in-process
+MIN_PARALLEL_CHANNELS = 200
+# Bump when load_epg_channels' output changes so stale cached channel lists are ignored
+EPG_CACHE_VERSION = 1
+
+# Maximum number of EPG files downloaded in parallel
+MAX_DOWNLOAD_WORKERS = 8
+# Per-directory record of ETag/Last-Modified values for downloaded files
+DOWNLOAD_META_FILE = '.meta.json'
+_download_meta_lock = threading.Lock()
+# Parsed EPG sources files by path, with the mtime they were read at
+_epg_sources_cache = {}
+# Chunk size for streaming downloads to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+# Connect and read timeouts (seconds) for downloads, so a stalled
+# connection can't hang every country sharing the process
+DOWNLOAD_TIMEOUT = (5, 60)
+
+# One session for all downloads, so files from the same host reuse
+# keep-alive connections instead of reconnecting for every file
+_SESSION = None
+if requests is not None:
+    _SESSION = requests.Session()
+    _RETRY = Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504))
+    _SESSION.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=_RETRY))
+    _SESSION.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=_RETRY))
+    _SESSION.headers['User-Agent'] = 'home-epg/1.0'
+
+def _session_get(url, headers):
+    """Start a streaming GET through the shared session"""
+    if _SESSION is None:
+        raise ImportError("the requests package is required for downloading files (pip install requests)")
+    return _SESSION.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+
+# Stream each thread's progress messages go to (sys.stdout when unset),
+# so callers running several countries at once can keep their output apart
+_output = threading.local()
+
+def _print(*args, sep=' ', end='\n'):
+    """Print a message to the current thread's output stream in a single write"""
+    stream = getattr(_output, 'stream', None) or sys.stdout
+    stream.write(sep.join(map(str, args)) + end)
+
+@contextmanager
+def redirect_output(stream):
+    """Send this thread's progress messages to a stream (None for sys.stdout)"""
+    previous = getattr(_output, 'stream', None)
+    _output.stream = stream
+    try:
+        yield stream
+    finally:
+        _output.stream = previous
+
+# Patterns for the channel name and tvg-id in an M3U #EXTINF line
+_RE_EXTINF_NAME = re.compile(r',(.+)$')
+_RE_TVG_ID = re.compile(r'tvg-id="([^"]*)"')
+# Country code in a legacy EPG source filename (e.g., epg_ripper_UK1.xml.gz -> UK)
+_RE_EPG_RIPPER = re.compile(r'epg_ripper_([A-Z]{2})(?:_[A-Z]+)?(?:\d*)\.xml')
 
 def load_playlist_from_xml(xml_content):
     """Load channels from XML content that contains channel information"""
     try:
-        # Parse the XML content
+        # Parse the XML content (lxml only accepts an encoding declaration in bytes)
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode('utf-8')
         root = ET.fromstring(xml_content)
         
         channels = []
@@ -60,258 +149,423 @@ def load_playlist_from_xml(xml_content):
                     'url': f'#EXTURL:{channel_id}'  # Placeholder URL
                 })
         
-        print(f"Found {len(channels)} channels in XML playlist")
+        _print(f"Found {len(channels)} channels in XML playlist")
         return channels
     except Exception as e:
-        print(f"Error parsing XML playlist: {e}")
+        _print(f"Error parsing XML playlist: {e}")
         return []
 
+def _parse_m3u_lines(lines, country_prefix=None):
+    """Parse channels from an iterable of M3U lines"""
+    channels = []
+    # An included #EXTINF line waiting for its URL on the next line
+    pending = None
+    
+    # Get TV channels only
+    for line in lines:
+        line = line.rstrip('\n')
+        if pending is not None:
+            # Get the URL from the next line
+            if not line.startswith("#"):
+                channel_info, channel_name, clean_name = pending
+                url = line.strip()
+                # Extract tvg-id if available
+                tvg_id_match = _RE_TVG_ID.search(channel_info)
+                tvg_id = tvg_id_match.group(1) if tvg_id_match else ""
+                
+                channels.append({
+                    'name': channel_name,
+                    'clean_name': clean_name,
+                    'tvg_id': tvg_id,
+                    'info': channel_info,
+                    'url': url
+                })
+            pending = None
+        
+        if not line.startswith("#EXTINF"):
+            continue
+        # A channel name can only start with the prefix if the line contains it
+        if country_prefix and country_prefix not in line:
+            continue
+        
+        # Extract channel name
+        channel_name_match = _RE_EXTINF_NAME.search(line)
+        if channel_name_match:
+            channel_name = channel_name_match.group(1).strip()
+            
+            # Apply country filter if specified (only include channels that start with the prefix)
+            if country_prefix and not channel_name.startswith(country_prefix):
+                continue
+            
+            # Clean name (remove country prefix)
+            clean_name = channel_name
+            if country_prefix:
+                clean_name = channel_name[len(country_prefix):].strip()
+            
+            pending = (line, channel_name, clean_name)
+    
+    return channels
+
 def load_playlist_channels(file_path, country_prefix=None):
     """Load channels from M3U playlist file with optional country filtering"""
     if not os.path.exists(file_path):
-        print(f"Playlist file not found: {file_path}")
+        _print(f"Playlist file not found: {file_path}")
         return []
     
-    print(f"Loading playlist from {file_path}...")
+    _print(f"Loading playlist from {file_path}...")
     try:
-        # Check if the file is XML
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+            # Check if the file is XML from its first few KB: if it starts with
+            # XML declaration or contains <tv> tag, treat as XML
+            head = f.read(4096)
+            is_xml = head.strip().startswith('<?xml') or '<tv>' in head
+            if is_xml:
+                content = head + f.read()
+            else:
+                # Otherwise, process as M3U straight from the file
+                f.seek(0)
+                channels = _parse_m3u_lines(f, country_prefix)
         
-        # If it starts with XML declaration or contains <tv> tag, treat as XML
-        if content.strip().startswith('<?xml') or '<tv>' in content:
-            print("Detected XML format in playlist file")
+        if is_xml:
+            _print("Detected XML format in playlist file")
             channels = load_playlist_from_xml(content)
             
             # Apply country filter if specified
             if country_prefix and channels:
                 filtered_channels = []
                 
-                print(f"Filtering channels by country prefix: {country_prefix}")
+                _print(f"Filtering channels by country prefix: {country_prefix}")
                 for channel in channels:
                     # Only include channels that start with the prefix
                     if channel['name'].startswith(country_prefix):
                         filtered_channels.append(channel)
                 
-                print(f"Found {len(filtered_channels)} channels with prefix: {country_prefix}")
+                _print(f"Found {len(filtered_channels)} channels with prefix: {country_prefix}")
                 return filtered_channels
             
             return channels
         
-        # Otherwise, process as M3U
-        channels = []
-        lines = content.splitlines()
-        
-        # Get TV channels only
-        for i in range(len(lines)):
-            if lines[i].startswith("#EXTINF"):
-                # Get the channel info from current line
-                channel_info = lines[i]
-                # Extract channel name
-                channel_name_match = re.search(r',(.+)$', channel_info)
-                if channel_name_match:
-                    channel_name = channel_name_match.group(1).strip()
-                    
-                    # Apply country filter if specified
-                    include_channel = True
-                    if country_prefix:
-                        # Only include channels that start with the prefix
-                        include_channel = channel_name.startswith(country_prefix)
-                    
-                    if include_channel:
-                        # Get the URL from the next line
-                        if i + 1 < len(lines) and not lines[i + 1].startswith("#"):
-                            url = lines[i + 1].strip()
-                            # Extract tvg-id if available
-                            tvg_id_match = re.search(r'tvg-id="([^"]*)"', channel_info)
-                            tvg_id = tvg_id_match.group(1) if tvg_id_match else ""
-                            
-                            # Clean name (remove country prefix)
-                            clean_name = channel_name
-                            if country_prefix and channel_name.startswith(country_prefix):
-                                clean_name = channel_name[len(country_prefix):].strip()
-                            
-                            channels.append({
-                                'name': channel_name,
-                                'clean_name': clean_name,
-                                'tvg_id': tvg_id,
-                                'info': channel_info,
-                                'url': url
-                            })
-        
         if country_prefix:
-            print(f"Found {len(channels)} channels with prefix: {country_prefix}")
+            _print(f"Found {len(channels)} channels with prefix: {country_prefix}")
         else:
-            print(f"Found {len(channels)} channels in playlist")
+            _print(f"Found {len(channels)} channels in playlist")
         return channels
     except Exception as e:
-        print(f"Error loading playlist: {e}")
+        _print(f"Error loading playlist: {e}")
         return []
 
+def _epg_channels_cache_path(epg_file):
+    """Return the path of the cached channel list for an EPG file"""
+    return os.path.join(os.path.dirname(os.path.abspath(epg_file)), '.cache', os.path.basename(epg_file) + '.channels.pkl')
+
+def _write_cache(cache_path, cache_key, value):
+    """Pickle a value with the key it was computed for, replacing the cache file atomically"""
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        # A unique temporary file keeps concurrent writers from clobbering each other
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((cache_key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except Exception as e:
+        _print(f"Warning: could not write cache {cache_path}: {e}")
+
 def load_epg_channels(epg_file_path):
     """Load channel information from EPG XML file"""
     if not os.path.exists(epg_file_path):
-        print(f"EPG file not found: {epg_file_path}")
+        _print(f"EPG file not found: {epg_file_path}")
         return []
     
-    print(f"Loading EPG data from {epg_file_path}...")
+    _print(f"Loading EPG data from {epg_file_path}...")
+    
+    # Reuse the channels parsed on a previous run if the file hasn't changed
+    cache_path = _epg_channels_cache_path(epg_file_path)
+    cache_key = None
+    try:
+        st = os.stat(epg_file_path)
+        cache_key = (EPG_CACHE_VERSION, st.st_mtime_ns, st.st_size)
+        with open(cache_path, 'rb') as f:
+            cached_key, cached_channels = pickle.load(f)
+        if cached_key == cache_key:
+            _print(f"Loaded {len(cached_channels)} channels from cache {cache_path}")
+            return cached_channels
+    except Exception:
+        pass
+    
     try:
-        # Parse the XML file
-        tree = ET.parse(epg_file_path)
-        root = tree.getroot()
+        # Stream the file, dropping each element once seen so the
+        # programme listings are never held in memory
+        context = ET.iterparse(epg_file_path, events=('start', 'end'))
+        _, root = next(context)
         
         epg_channels = []
         
         # Extract channel information
-        for channel in root.findall(".//channel"):
-            channel_id = channel.get('id')
-            
-            # Get display names
-            display_names = []
-            for display_name in channel.findall(".//display-name"):
-                if display_name.text:
-                    display_names.append(display_name.text.strip())
-            
-            # Get icons
-            icons = []
-            for icon in channel.findall(".//icon"):
-                src = icon.get('src')
-                if src:
-                    icons.append(src)
+        for event, elem in context:
+            if event != 'end' or elem.tag not in ('channel', 'programme'):
+                continue
+            if elem.tag == 'channel':
+                channel = elem
+                channel_id = channel.get('id')
+                
+                # Get display names
+                display_names = []
+                for display_name in channel.iter('display-name'):
+                    if display_name.text:
+                        display_names.append(display_name.text.strip())
+                
+                # Get icons
+                icons = []
+                for icon in channel.iter('icon'):
+                    src = icon.get('src')
+                    if src:
+                        icons.append(src)
+                
+                if channel_id and display_names:
+                    epg_channels.append({
+                        'id': channel_id,
+                        'display_names': display_names,
+                        'primary_name': display_names[0] if display_names else "",
+                        'icons': icons
+                    })
             
-            if channel_id and display_names:
-                epg_channels.append({
-                    'id': channel_id,
-                    'display_names': display_names,
-                    'primary_name': display_names[0] if display_names else "",
-                    'icons': icons
-                })
+            root.clear()
         
-        print(f"Loaded {len(epg_channels)} channels from EPG data")
+        _print(f"Loaded {len(epg_channels)} channels from EPG data")
+        if cache_key is not None:
+            _write_cache(cache_path, cache_key, epg_channels)
         return epg_channels
     except Exception as e:
-        print(f"Error loading EPG file: {e}")
+        _print(f"Error loading EPG file: {e}")
         return []
 
+# Patterns used by clean_channel_name, compiled once
+# (each country prefix can only be followed by the ones listed after it)
+_RE_PREFIX = re.compile(r'^(?:UK:\s*)?(?:US:\s*)?(?:IN:\s*)?(?:CA:\s*)?', re.IGNORECASE)
+_RE_SPACE = re.compile(r'\s+')
+_RE_QUALITY = re.compile(r'\b(HD|SD|FHD|UHD|4K|HEVC|H265|H\.265)\b', re.IGNORECASE)
+_RE_QUALITY_SUFFIX = re.compile(r'\s+(HD|SD|FHD|UHD|4K)$', re.IGNORECASE)
+_RE_SUFFIX = re.compile(r'\s+(CHANNEL|TV|NETWORK|INDIA)\s*$', re.IGNORECASE)
+_RE_PUNCT = re.compile(r'[^\w\s]')
+_AND_TABLE = str.maketrans({'&': ' AND ', '+': ' AND '})
+
+@lru_cache(maxsize=65536)
 def clean_channel_name(name):
     """Clean channel name for better matching"""
     # Remove common prefixes
-    for prefix in ["UK:", "US:", "IN:", "CA:"]:
-        if name.upper().startswith(prefix):
-            name = name[len(prefix):].strip()
+    name = _RE_PREFIX.sub('', name)
     
     # Standardize spacing
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = _RE_SPACE.sub(' ', name).strip()
     
     # Remove HD/SD/FHD/UHD quality indicators
-    name = re.sub(r'\b(HD|SD|FHD|UHD|4K|HEVC|H265|H\.265)\b', '', name, flags=re.IGNORECASE)
-    name = re.sub(r'\s+(HD|SD|FHD|UHD|4K)$', '', name, flags=re.IGNORECASE)
+    name = _RE_QUALITY.sub('', name)
+    name = _RE_QUALITY_SUFFIX.sub('', name)
     
     # Remove other common suffixes
-    name = re.sub(r'\s+(CHANNEL|TV|NETWORK|INDIA)\s*$', '', name, flags=re.IGNORECASE)
+    name = _RE_SUFFIX.sub('', name)
     
     # Remove common punctuation that might affect matching
-    name = re.sub(r'[&+]', ' AND ', name)
-    name = re.sub(r'[^\w\s]', ' ', name)
+    name = name.translate(_AND_TABLE)
+    name = _RE_PUNCT.sub(' ', name)
     
     # Standardize spacing again after all replacements
-    name = re.sub(r'\s+', ' ', name).strip()
+    name = _RE_SPACE.sub(' ', name).strip()
     
     return name.strip().upper()
 
-def find_best_match(channel, epg_channels, threshold=70, quiet=True):
+def build_epg_name_index(epg_channels):
+    """Clean every EPG display name once for find_best_match"""
+    names = []
+    entries = []
+    exact = {}
+    for epg_channel in epg_channels:
+        for display_name in epg_channel['display_names']:
+            clean_epg_name = clean_channel_name(display_name)
+            names.append(clean_epg_name)
+            entries.append((epg_channel, display_name))
+            # Keep the first channel with each name, as the exact match
+            exact.setdefault(clean_epg_name, (epg_channel, display_name))
+    return names, entries, exact
+
+def find_best_match(channel, epg_channels, threshold=70, quiet=True, epg_index=None):
     """Find the best matching EPG channel for a given playlist channel"""
     clean_name = clean_channel_name(channel['clean_name'])
-    best_match = None
-    best_score = 0
-    best_method = None
+    names, entries, exact = epg_index or build_epg_name_index(epg_channels)
     
     # For debugging
     if not quiet:
-        print(f"Finding match for: {channel['name']} → Cleaned to: {clean_name}")
+        _print(f"Finding match for: {channel['name']} → Cleaned to: {clean_name}")
     
     # Try exact match first (case insensitive)
-    for epg_channel in epg_channels:
-        for display_name in epg_channel['display_names']:
-            clean_epg_name = clean_channel_name(display_name)
-            if clean_name == clean_epg_name:
-                if not quiet:
-                    print(f"  Exact match found: {display_name} ({epg_channel['id']})")
-                return {
-                    'epg_channel': epg_channel,
-                    'score': 100,
-                    'method': 'Exact match'
-                }
+    if clean_name in exact:
+        epg_channel, display_name = exact[clean_name]
+        if not quiet:
+            _print(f"  Exact match found: {display_name} ({epg_channel['id']})")
+        return {
+            'epg_channel': epg_channel,
+            'score': 100,
+            'method': 'Exact match'
+        }
     
-    # Try fuzzy matching
-    for epg_channel in epg_channels:
-        for display_name in epg_channel['display_names']:
-            clean_epg_name = clean_channel_name(display_name)
-            
-            # Try different fuzzy matching methods
-            ratio = fuzz.ratio(clean_name, clean_epg_name)
-            partial_ratio = fuzz.partial_ratio(clean_name, clean_epg_name)
-            token_sort_ratio = fuzz.token_sort_ratio(clean_name, clean_epg_name)
-            token_set_ratio = fuzz.token_set_ratio(clean_name, clean_epg_name)
-            
-            # Use the best score from any method
-            current_best = best_score
-            
-            if ratio > best_score:
-                best_score = ratio
-                best_match = epg_channel
-                best_method = 'String similarity'
-            
-            if partial_ratio > best_score:
-                best_score = partial_ratio
-                best_match = epg_channel
-                best_method = 'Partial match'
-            
-            if token_sort_ratio > best_score:
-                best_score = token_sort_ratio
-                best_match = epg_channel
-                best_method = 'Token sort'
-                
-            if token_set_ratio > best_score:
-                best_score = token_set_ratio
-                best_match = epg_channel
-                best_method = 'Token set'
-                
-            # Print high-scoring matches for debugging
-            if not quiet and best_score > current_best and best_score >= 80:
-                print(f"  Good match: {display_name} - Score: {best_score}% ({best_method})")
+    # Try fuzzy matching: score every EPG name with each method in one
+    # call. Each method picks the EPG name with the highest unrounded score;
+    # when methods tie on the rounded score, the earlier EPG name and then
+    # the earlier method wins
+    best_score = 0
+    best_index = None
+    best_method = None
+    for scorer, method in FUZZY_METHODS:
+        # Nothing beats a perfect score, so later methods can only win the
+        # tie with an earlier EPG name
+        choices = names
+        if best_score >= 100:
+            if best_index == 0:
+                break
+            choices = names[:best_index]
+        # Scores are rounded to whole percentages, so anything that rounds up
+        # to the threshold (or ties the best score so far) still counts; the
+        # rising cutoff lets later methods abandon weaker names early
+        result = process.extractOne(clean_name, choices, scorer=scorer,
+                                    score_cutoff=max(0, threshold - 0.5, best_score - 0.5))
+        if result is None:
+            continue
+        score, index = round(result[1]), result[2]
+        if best_index is None or score > best_score or (score == best_score and index < best_index):
+            best_score, best_index, best_method = score, index, method
     
-    if best_score >= threshold:
+    if best_index is not None and best_score >= threshold:
+        epg_channel, display_name = entries[best_index]
+        if not quiet:
+            _print(f"  Best match: {display_name} - Score: {best_score}% ({best_method})")
         return {
-            'epg_channel': best_match,
+            'epg_channel': epg_channel,
             'score': best_score,
             'method': best_method
         }
     else:
         if not quiet:
-            print(f"  No good match found. Best score: {best_score}%")
+            _print("  No good match found.")
         return None
 
-def match_channels(playlist_channels, epg_file, threshold=70, quiet=True):
-    """Match playlist channels with EPG data"""
+def find_best_matches(playlist_channels, epg_channels, threshold=70, epg_index=None, workers=-1):
+    """Find the best matching EPG channel for every playlist channel at once"""
+    epg_index = epg_index or build_epg_name_index(epg_channels)
+    names, entries, exact = epg_index
+    # cdist pays off by scoring on every core; on a single core the
+    # per-name extractOne prunes more work with its rising score cutoff
+    if np is None or not names or (os.cpu_count() or 1) < 2:
+        return [find_best_match(channel, epg_channels, threshold, True, epg_index) for channel in playlist_channels]
+    
+    epg_matches = [None] * len(playlist_channels)
+    fuzzy_rows = []
+    queries = []
+    for row, channel in enumerate(playlist_channels):
+        clean_name = clean_channel_name(channel['clean_name'])
+        if clean_name in exact:
+            epg_matches[row] = {
+                'epg_channel': exact[clean_name][0],
+                'score': 100,
+                'method': 'Exact match'
+            }
+        else:
+            fuzzy_rows.append(row)
+            queries.append(clean_name)
+    
+    # Score blocks of playlist names against all EPG names, with the same
+    # tie-breaking as find_best_match: each method picks the highest
+    # unrounded score, and methods tying on the rounded score resolve to
+    # the earlier EPG name, then the earlier method
+    block = max(1, CDIST_BLOCK_SIZE // len(names))
+    for start in range(0, len(queries), block):
+        block_queries = queries[start:start + block]
+        rows = np.arange(len(block_queries))
+        best_score = np.zeros(len(block_queries))
+        best_index = np.full(len(block_queries), len(names))
+        best_method = np.zeros(len(block_queries), dtype=np.intp)
+        for order, (scorer, method) in enumerate(FUZZY_METHODS):
+            scores = process.cdist(block_queries, names, scorer=scorer,
+                                   score_cutoff=max(0, threshold - 0.5), workers=workers)
+            index = scores.argmax(axis=1)
+            score = np.round(scores[rows, index])
+            better = (score > best_score) | ((score == best_score) & (index < best_index))
+            best_score = np.where(better, score, best_score)
+            best_index = np.where(better, index, best_index)
+            best_method = np.where(better, order, best_method)
+        
+        for row, score, index, order in zip(fuzzy_rows[start:start + block], best_score.tolist(),
+                                            best_index.tolist(), best_method.tolist()):
+            if score >= threshold:
+                epg_matches[row] = {
+                    'epg_channel': entries[index][0],
+                    'score': int(score),
+                    'method': FUZZY_METHODS[order][1]
+                }
+    
+    return epg_matches
+
+# EPG channels, their name index and threshold shared by the match worker processes
+_worker_epg_channels = None
+_worker_epg_index = None
+_worker_threshold = None
+
+def _init_match_worker(epg_channels, threshold):
+    """Store the EPG channels once per worker process"""
+    global _worker_epg_channels, _worker_epg_index, _worker_threshold
+    _worker_epg_channels = epg_channels
+    _worker_epg_index = build_epg_name_index(epg_channels)
+    _worker_threshold = threshold
+
+def _match_chunk(channels):
+    """Find the best EPG match for each channel in a chunk of the playlist"""
+    return [find_best_match(channel, _worker_epg_channels, _worker_threshold, epg_index=_worker_epg_index) for channel in channels]
+
+def match_channels(playlist_channels, epg_file, threshold=70, quiet=True, parallel=True):
+    """Match playlist channels with EPG data (parallel=False keeps it to the calling thread)"""
     epg_channels = load_epg_channels(epg_file)
     if not epg_channels:
         return []
     
-    matches = []
-    for channel in playlist_channels:
-        epg_match = find_best_match(channel, epg_channels, threshold, quiet)
-        matches.append({
-            'playlist_channel': channel,
-            'epg_match': epg_match
-        })
+    workers = os.cpu_count() or 1
+    if quiet and workers > 1 and np is not None:
+        # cdist already spreads the scoring over all cores; callers running
+        # several matches at once score on their own thread instead so the
+        # cores aren't oversubscribed
+        epg_matches = find_best_matches(playlist_channels, epg_channels, threshold,
+                                        workers=-1 if parallel else 1)
+    elif parallel and quiet and workers > 1 and len(playlist_channels) >= MIN_PARALLEL_CHANNELS:
+        # Fuzzy matching is CPU-bound, so spread the playlist over worker
+        # processes; each worker receives the EPG channels once at startup
+        chunk_size = max(1, -(-len(playlist_channels) // (workers * 4)))
+        chunks = [playlist_channels[i:i + chunk_size] for i in range(0, len(playlist_channels), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_match_worker,
+                                 initargs=(epg_channels, threshold)) as executor:
+            epg_matches = [m for chunk_matches in executor.map(_match_chunk, chunks) for m in chunk_matches]
+    else:
+        # Clean the EPG names once rather than once per playlist channel
+        # (verbose output would interleave across processes, and concurrent
+        # callers already keep the cores busy, so keep it serial)
+        epg_index = build_epg_name_index(epg_channels)
+        epg_matches = [find_best_match(channel, epg_channels, threshold, quiet, epg_index) for channel in playlist_channels]
     
-    # Count matches
-    matched_count = sum(1 for m in matches if m['epg_match'])
-    perfect_matches = sum(1 for m in matches if m['epg_match'] and m['epg_match']['score'] == 100)
+    matches = [{'playlist_channel': channel, 'epg_match': epg_match}
+               for channel, epg_match in zip(playlist_channels, epg_matches)]
     
-    print(f"Found matches for {matched_count} out of {len(playlist_channels)} channels ({matched_count/len(playlist_channels)*100:.1f}%)")
-    print(f"Perfect matches (100% score): {perfect_matches}")
+    # Count matches and perfect matches in a single pass
+    matched_count = perfect_matches = 0
+    for epg_match in epg_matches:
+        if epg_match:
+            matched_count += 1
+            if epg_match['score'] == 100:
+                perfect_matches += 1
+    
+    _print(f"Found matches for {matched_count} out of {len(playlist_channels)} channels ({matched_count/len(playlist_channels)*100:.1f}%)")
+    _print(f"Perfect matches (100% score): {perfect_matches}")
     
     return matches
 
@@ -323,28 +577,28 @@ def display_matches(matches, show_all=False, only_perfect=False):
     # Filter based on options
     if only_perfect:
         sorted_matches = [m for m in sorted_matches if m['epg_match'] and m['epg_match']['score'] == 100]
-        print(f"\nShowing {len(sorted_matches)} perfect matches (100% score):")
+        _print(f"\nShowing {len(sorted_matches)} perfect matches (100% score):")
     elif not show_all:
         sorted_matches = [m for m in sorted_matches if m['epg_match']]
-        print(f"\nShowing {len(sorted_matches)} channel matches:")
+        _print(f"\nShowing {len(sorted_matches)} channel matches:")
     else:
-        print(f"\nShowing all {len(sorted_matches)} channels:")
+        _print(f"\nShowing all {len(sorted_matches)} channels:")
     
-    print("-" * 80)
+    _print("-" * 80)
     
     for i, match in enumerate(sorted_matches, 1):
-        print(f"{i}. Playlist Channel: {match['playlist_channel']['name']}")
+        _print(f"{i}. Playlist Channel: {match['playlist_channel']['name']}")
         
         if match['epg_match']:
-            print(f"   EPG Channel: {match['epg_match']['epg_channel']['primary_name']}")
-            print(f"   EPG ID: {match['epg_match']['epg_channel']['id']}")
-            print(f"   Match Score: {match['epg_match']['score']}% ({match['epg_match']['method']})")
+            _print(f"   EPG Channel: {match['epg_match']['epg_channel']['primary_name']}")
+            _print(f"   EPG ID: {match['epg_match']['epg_channel']['id']}")
+            _print(f"   Match Score: {match['epg_match']['score']}% ({match['epg_match']['method']})")
             if match['epg_match']['epg_channel']['icons']:
-                print(f"   Icon: {match['epg_match']['epg_channel']['icons'][0]}")
+                _print(f"   Icon: {match['epg_match']['epg_channel']['icons'][0]}")
         else:
-            print("   No EPG match found")
+            _print("   No EPG match found")
         
-        print("-" * 80)
+        _print("-" * 80)
 
 def export_matches_to_csv(matches, filename, only_perfect=False):
     """Export channel matches to CSV file"""
@@ -379,14 +633,20 @@ def export_matches_to_csv(matches, filename, only_perfect=False):
                 }
                 writer.writerow(row)
         
-        print(f"Exported {len(matches_to_export)} channel matches to {filename}")
+        _print(f"Exported {len(matches_to_export)} channel matches to {filename}")
     except Exception as e:
-        print(f"Error exporting to CSV: {e}")
+        _print(f"Error exporting to CSV: {e}")
+
+def _tv_start_tag(attrib):
+    """Serialize an open <tv> tag with the given attributes"""
+    # Let the serializer escape the attributes, then turn the empty
+    # element it produces into an open tag
+    return ET.tostring(ET.Element('tv', attrib), encoding='utf-8').rstrip(b'/>').rstrip() + b'>'
 
 def generate_filtered_epg_xml(matches, input_epg_file, output_file, only_perfect=True):
     """Generate a filtered EPG XML file containing only matched channels and their programs"""
     if not os.path.exists(input_epg_file):
-        print(f"EPG file not found: {input_epg_file}")
+        _print(f"EPG file not found: {input_epg_file}")
         return False
     
     # Filter for perfect matches if requested
@@ -396,77 +656,79 @@ def generate_filtered_epg_xml(matches, input_epg_file, output_file, only_perfect
         matches_to_include = [m for m in matches if m['epg_match']]
     
     if not matches_to_include:
-        print("No matches to include in the filtered EPG file.")
+        _print("No matches to include in the filtered EPG file.")
         return False
     
     try:
-        # Parse the original EPG file
-        tree = ET.parse(input_epg_file)
-        root = tree.getroot()
-        
-        # Create a new XML root with the same structure
-        new_root = ET.Element('tv')
-        for attr_name, attr_value in root.attrib.items():
-            new_root.set(attr_name, attr_value)
-        
         # Track channel IDs to include
-        channel_ids_to_include = set()
-        
-        # Add matched channels to the new XML
-        for match in matches_to_include:
-            epg_channel_id = match['epg_match']['epg_channel']['id']
-            channel_ids_to_include.add(epg_channel_id)
-            
-            # Find the original channel element
-            for channel_elem in root.findall(".//channel[@id='{}']".format(epg_channel_id)):
-                # Create a new channel element
-                new_channel = ET.SubElement(new_root, 'channel', id=epg_channel_id)
-                
-                # Use the playlist channel name as the display name
-                display_name = ET.SubElement(new_channel, 'display-name')
-                display_name.text = match['playlist_channel']['name']
-                
-                # Copy icons if they exist
-                for icon in channel_elem.findall('.//icon'):
-                    new_icon = ET.SubElement(new_channel, 'icon', src=icon.get('src', ''))
-                
-                # Copy any other elements
-                for child in channel_elem:
-                    if child.tag != 'display-name' and child.tag != 'icon':
-                        new_channel.append(child)
-        
-        # Add program entries for the included channels
-        for program in root.findall(".//programme"):
-            channel_id = program.get('channel')
-            if channel_id in channel_ids_to_include:
-                # Copy the program element and all its children
-                new_program = ET.Element('programme')
-                for attr_name, attr_value in program.attrib.items():
-                    new_program.set(attr_name, attr_value)
-                
-                for child in program:
-                    new_program.append(child)
-                
-                new_root.append(new_program)
-        
-        # Create a new XML tree and write to file
-        new_tree = ET.ElementTree(new_root)
-        
-        # Count the number of programs included
-        program_count = len(new_root.findall(".//programme"))
-        channel_count = len(new_root.findall(".//channel"))
+        channel_ids_to_include = frozenset(match['epg_match']['epg_channel']['id'] for match in matches_to_include)
+        
+        # First pass: stream the file, keeping only the matched channel elements
+        channel_elems = {}
+        context = ET.iterparse(input_epg_file, events=('start', 'end'))
+        _, root = next(context)
+        tv_attrib = dict(root.attrib)
+        for event, elem in context:
+            if event != 'end' or elem.tag not in ('channel', 'programme'):
+                continue
+            if elem.tag == 'channel' and elem.get('id') in channel_ids_to_include:
+                channel_elems.setdefault(elem.get('id'), []).append(elem)
+            root.clear()
         
-        # Write the new XML file with proper formatting
         with open(output_file, 'wb') as f:
             f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
-            new_tree.write(f, encoding='utf-8')
+            f.write(_tv_start_tag(tv_attrib))
+            
+            # Add matched channels to the new XML
+            channel_count = 0
+            for match in matches_to_include:
+                epg_channel_id = match['epg_match']['epg_channel']['id']
+                
+                # Find the original channel element
+                for channel_elem in channel_elems.get(epg_channel_id, ()):
+                    # Create a new channel element
+                    new_channel = ET.Element('channel', id=epg_channel_id)
+                    
+                    # Use the playlist channel name as the display name
+                    display_name = ET.SubElement(new_channel, 'display-name')
+                    display_name.text = match['playlist_channel']['name']
+                    
+                    # Copy icons if they exist
+                    for icon in channel_elem.findall('.//icon'):
+                        new_icon = ET.SubElement(new_channel, 'icon', src=icon.get('src', ''))
+                    
+                    # Copy any other elements (lxml would move the originals out of the source)
+                    for child in channel_elem:
+                        if child.tag != 'display-name' and child.tag != 'icon':
+                            new_channel.append(deepcopy(child))
+                    
+                    f.write(ET.tostring(new_channel, encoding='utf-8'))
+                    channel_count += 1
+            
+            # Second pass: stream program entries for the included channels
+            # straight to the output
+            program_count = 0
+            context = ET.iterparse(input_epg_file, events=('start', 'end'))
+            _, root = next(context)
+            for event, elem in context:
+                if event != 'end' or elem.tag not in ('channel', 'programme'):
+                    continue
+                if elem.tag == 'programme' and elem.get('channel') in channel_ids_to_include:
+                    # Copy the program element and all its children
+                    new_program = ET.Element('programme', elem.attrib)
+                    new_program.extend(list(elem))
+                    f.write(ET.tostring(new_program, encoding='utf-8'))
+                    program_count += 1
+                root.clear()
+            
+            f.write(b'</tv>')
         
-        print(f"Generated filtered EPG file: {output_file}")
-        print(f"Included {channel_count} channels and {program_count} program entries")
+        _print(f"Generated filtered EPG file: {output_file}")
+        _print(f"Included {channel_count} channels and {program_count} program entries")
         return True
     
     except Exception as e:
-        print(f"Error generating filtered EPG file: {e}")
+        _print(f"Error generating filtered EPG file: {e}")
         return False
 
 def generate_consolidated_epg_xml(matches, epg_files, output_file, only_perfect=True):
@@ -478,117 +740,133 @@ def generate_consolidated_epg_xml(matches, epg_files, output_file, only_perfect=
         matches_to_include = [m for m in matches if m.get('epg_match')]
     
     if not matches_to_include:
-        print("No matches to include in the consolidated EPG file.")
+        _print("No matches to include in the consolidated EPG file.")
         return False
     
     try:
-        # Create a new XML root
-        new_root = ET.Element('tv')
-        new_root.set('generator-info-name', 'Consolidated EPG Generator')
-        new_root.set('generator-info-url', 'https://github.com/yourusername/epg-tools')
-        
-        # Track channel IDs to avoid duplicates
-        added_channel_ids = set()
-        
-        # Create a mapping of source files to their parsed XML trees
-        epg_trees = {}
-        for epg_file in epg_files:
-            if os.path.exists(epg_file):
-                try:
-                    tree = ET.parse(epg_file)
-                    epg_trees[epg_file] = tree
-                except Exception as e:
-                    print(f"Error parsing EPG file {epg_file}: {e}")
-        
-        # Add matched channels to the new XML
-        for match in matches_to_include:
-            if not match.get('epg_match') or not match.get('source_file'):
-                continue
-                
-            epg_channel_id = match['epg_match']['epg_channel']['id']
-            source_file = match.get('source_file')
-            
-            # Find the full path of the source file
-            source_file_path = None
-            for epg_file in epg_files:
-                if os.path.basename(epg_file) == source_file:
-                    source_file_path = epg_file
-                    break
-            
-            if not source_file_path or source_file_path not in epg_trees:
-                continue
-            
-            root = epg_trees[source_file_path].getroot()
-            
-            # Skip if we've already added this channel ID
-            if epg_channel_id in added_channel_ids:
-                continue
-            
-            # Find the original channel element
-            channel_elem = root.find(f".//channel[@id='{epg_channel_id}']")
-            if channel_elem is None:
-                continue
-                
-            # Create a new channel element
-            new_channel = ET.SubElement(new_root, 'channel', id=epg_channel_id)
-            
-            # Use the playlist channel name as the display name
-            display_name = ET.SubElement(new_channel, 'display-name')
-            display_name.text = match['playlist_channel']['name']
-            
-            # Copy icons if they exist
-            for icon in channel_elem.findall('.//icon'):
-                new_icon = ET.SubElement(new_channel, 'icon', src=icon.get('src', ''))
-            
-            # Copy any other elements
-            for child in channel_elem:
-                if child.tag != 'display-name' and child.tag != 'icon':
-                    new_channel.append(ET.fromstring(ET.tostring(child)))
-            
-            # Mark this channel ID as added
-            added_channel_ids.add(epg_channel_id)
-        
-        # Add program entries for the included channels
-        for epg_file, tree in epg_trees.items():
-            root = tree.getroot()
-            for program in root.findall(".//programme"):
-                channel_id = program.get('channel')
-                if channel_id in added_channel_ids:
-                    # Copy the program element and all its children
-                    new_program = ET.Element('programme')
-                    for attr_name, attr_value in program.attrib.items():
-                        new_program.set(attr_name, attr_value)
-                    
-                    for child in program:
-                        new_program.append(ET.fromstring(ET.tostring(child)))
-                    
-                    new_root.append(new_program)
-        
-        # Create a new XML tree and write to file
-        new_tree = ET.ElementTree(new_root)
-        
-        # Count the number of programs included
-        program_count = len(new_root.findall(".//programme"))
-        channel_count = len(new_root.findall(".//channel"))
-        
-        # Write the new XML file with proper formatting
         with open(output_file, 'wb') as f:
-            f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
-            new_tree.write(f, encoding='utf-8')
-        
-        print(f"Generated consolidated EPG file: {output_file}")
-        print(f"Included {channel_count} channels and {program_count} program entries")
-        return True
-    
+            success = generate_consolidated_epg_stream(matches_to_include, epg_files, f)
+        return success
     except Exception as e:
-        print(f"Error generating consolidated EPG file: {e}")
+        _print(f"Error generating consolidated EPG file: {e}")
         return False
 
+def generate_consolidated_epg_stream(matches_to_include, epg_files, out_fh):
+    """Stream a consolidated EPG for the given matches into an open binary file"""
+    # Work out which channel IDs are needed from which source file (the first
+    # EPG file with a matching basename wins)
+    path_by_basename = {}
+    for epg_file in epg_files:
+        path_by_basename.setdefault(os.path.basename(epg_file), epg_file)
+    
+    wanted_ids = {}
+    for match in matches_to_include:
+        if match.get('epg_match') and match.get('source_file') in path_by_basename:
+            source_file_path = path_by_basename[match['source_file']]
+            wanted_ids.setdefault(source_file_path, set()).add(match['epg_match']['epg_channel']['id'])
+    
+    # First pass: stream each file once, keeping only the channel elements
+    # that will be written
+    parsed_files = []
+    channel_elems = {}
+    for epg_file in dict.fromkeys(epg_files):
+        if not os.path.exists(epg_file):
+            continue
+        file_ids = wanted_ids.get(epg_file, set())
+        found = {}
+        try:
+            context = ET.iterparse(epg_file, events=('start', 'end'))
+            _, root = next(context)
+            for event, elem in context:
+                if event != 'end' or elem.tag not in ('channel', 'programme'):
+                    continue
+                channel_id = elem.get('id')
+                if elem.tag == 'channel' and channel_id in file_ids and channel_id not in found:
+                    found[channel_id] = elem
+                # Drop everything already seen; kept channels live on in `found`
+                root.clear()
+        except Exception as e:
+            _print(f"Error parsing EPG file {epg_file}: {e}")
+            continue
+        parsed_files.append(epg_file)
+        channel_elems[epg_file] = found
+    
+    out_fh.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+    out_fh.write(_tv_start_tag({
+        'generator-info-name': 'Consolidated EPG Generator',
+        'generator-info-url': 'https://github.com/yourusername/epg-tools'
+    }))
+    
+    # Add matched channels, skipping IDs that were already added
+    added_channel_ids = set()
+    channel_count = 0
+    for match in matches_to_include:
+        if not match.get('epg_match') or not match.get('source_file'):
+            continue
+        
+        epg_channel_id = match['epg_match']['epg_channel']['id']
+        source_file_path = path_by_basename.get(match['source_file'])
+        if source_file_path not in channel_elems:
+            continue
+        
+        # Skip if we've already added this channel ID
+        if epg_channel_id in added_channel_ids:
+            continue
+        
+        # Find the original channel element
+        channel_elem = channel_elems[source_file_path].get(epg_channel_id)
+        if channel_elem is None:
+            continue
+        
+        # Create a new channel element
+        new_channel = ET.Element('channel', id=epg_channel_id)
+        
+        # Use the playlist channel name as the display name
+        display_name = ET.SubElement(new_channel, 'display-name')
+        display_name.text = match['playlist_channel']['name']
+        
+        # Copy icons if they exist
+        for icon in channel_elem.findall('.//icon'):
+            ET.SubElement(new_channel, 'icon', src=icon.get('src', ''))
+        
+        # Copy any other elements (lxml would move the originals out of the source)
+        for child in channel_elem:
+            if child.tag != 'display-name' and child.tag != 'icon':
+                new_channel.append(deepcopy(child))
+        
+        out_fh.write(ET.tostring(new_channel, encoding='utf-8'))
+        channel_count += 1
+        
+        # Mark this channel ID as added
+        added_channel_ids.add(epg_channel_id)
+    
+    # Second pass: stream program entries for the included channels straight
+    # to the output, clearing each one once written
+    added_channel_ids = frozenset(added_channel_ids)
+    program_count = 0
+    for epg_file in parsed_files:
+        context = ET.iterparse(epg_file, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            if event != 'end' or elem.tag not in ('channel', 'programme'):
+                continue
+            if elem.tag == 'programme' and elem.get('channel') in added_channel_ids:
+                # Copy the program element's attributes and children
+                new_program = ET.Element('programme', elem.attrib)
+                new_program.extend(list(elem))
+                out_fh.write(ET.tostring(new_program, encoding='utf-8'))
+                program_count += 1
+            root.clear()
+    
+    out_fh.write(b'</tv>')
+    
+    _print(f"Generated consolidated EPG file: {getattr(out_fh, 'name', '<stream>')}")
+    _print(f"Included {channel_count} channels and {program_count} program entries")
+    return True
+
 def download_file(url, output_dir="downloads", file_type="generic"):
     """Download a file from a URL and save it to the output directory"""
-    import requests
     import os
-    import gzip
     import shutil
     
     try:
@@ -611,42 +889,79 @@ def download_file(url, output_dir="downloads", file_type="generic"):
             elif file_type == "epg":
                 filename += ".xml"
         
-        output_path = os.path.join(output_dir, filename)
-        
-        print(f"Downloading {file_type} from {url}...")
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        # Get the content
-        content = response.content
-        
-        # Save the downloaded file
-        with open(output_path, 'wb') as f:
-            f.write(content)
-        
-        print(f"Downloaded to {output_path}")
-        
-        # If it's a gzip file, decompress it
-        if filename.endswith('.gz'):
-            # Create proper output filename by removing .gz extension
-            decompressed_filename = os.path.splitext(filename)[0]  # Remove .gz extension
-            decompressed_path = os.path.join(output_dir, decompressed_filename)
+        # gzip files are decompressed as they download, so only the
+        # decompressed file is written
+        final_path = os.path.join(output_dir, os.path.splitext(filename)[0] if filename.endswith('.gz') else filename)
+        
+        # Send the validators from the last download so an unchanged file
+        # costs a 304 instead of a full transfer
+        headers = {}
+        meta = _load_download_meta(output_dir).get(url, {})
+        if os.path.exists(final_path):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        
+        _print(f"Downloading {file_type} from {url}...")
+        with _session_get(url, headers) as response:
+            if response.status_code == 304:
+                _print(f"Not modified, using {final_path}")
+                return final_path
+            response.raise_for_status()  # Raise an exception for HTTP errors
             
-            print(f"Decompressing {output_path}...")
-            with gzip.open(output_path, 'rb') as f_in:
-                with open(decompressed_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
+            # Forget the old validators before replacing the file they describe
+            if meta:
+                _save_download_meta(output_dir, url, None, None)
             
-            # Remove the compressed file after decompression
-            os.remove(output_path)
-            print(f"Decompressed to {decompressed_path}")
-            return decompressed_path
-        
-        return output_path
+            # Stream the body to disk rather than holding it all in memory,
+            # decompressing gzip files on the way instead of round-tripping
+            # the compressed file through disk. The body goes to a per-thread
+            # partial file that replaces final_path only once complete, so a
+            # failed or concurrent download never leaves a truncated file
+            response.raw.decode_content = True
+            part_path = f"{final_path}.{os.getpid()}.{threading.get_ident()}.part"
+            try:
+                if filename.endswith('.gz'):
+                    with gzip.GzipFile(fileobj=response.raw) as f_in:
+                        with open(part_path, 'wb') as f_out:
+                            shutil.copyfileobj(f_in, f_out, COPY_BUFFER_SIZE)
+                else:
+                    with open(part_path, 'wb') as f:
+                        shutil.copyfileobj(response.raw, f, COPY_BUFFER_SIZE)
+                os.replace(part_path, final_path)
+            except BaseException:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+        
+        _print(f"Downloaded to {final_path}")
+        
+        _save_download_meta(output_dir, url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return final_path
     except Exception as e:
-        print(f"Error downloading {url}: {e}")
+        _print(f"Error downloading {url}: {e}")
         return None
 
+def _load_download_meta(output_dir):
+    """Load the ETag/Last-Modified values recorded for previous downloads"""
+    try:
+        with open(os.path.join(output_dir, DOWNLOAD_META_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_download_meta(output_dir, url, etag, last_modified, **extra):
+    """Record the validators of a completed download"""
+    # Downloads run in parallel threads, so serialize the read-modify-write
+    with _download_meta_lock:
+        meta = _load_download_meta(output_dir)
+        meta[url] = {'etag': etag, 'last_modified': last_modified, **extra}
+        meta_path = os.path.join(output_dir, DOWNLOAD_META_FILE)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(meta_path + '.tmp', meta_path)
+
 # Keep the existing download_epg_file function for backward compatibility
 def download_epg_file(url, output_dir="epg_data"):
     """Download an EPG file from a URL and save it to the output directory"""
@@ -654,9 +969,9 @@ def download_epg_file(url, output_dir="epg_data"):
 
 def download_playlist_from_url(url, output_dir="playlist_data", force_download=False):
     """Download M3U playlist from a specified URL, with date in filename and only if needed"""
-    import requests
     import os
     import datetime
+    import shutil
     
     try:
         # Create the output directory if it doesn't exist
@@ -671,70 +986,62 @@ def download_playlist_from_url(url, output_dir="playlist_data", force_download=F
         
         # Check if we already have today's file
         if os.path.exists(output_path) and not force_download:
-            print(f"Using existing playlist file from today: {output_path}")
+            _print(f"Using existing playlist file from today: {output_path}")
             return output_path, 'm3u'
         
-        # Check for older files
-        if not force_download:
-            files = os.listdir(output_dir)
-            playlist_files = [f for f in files if f.startswith("playlist_") and f.endswith(".m3u")]
+        # Send the validators from the last download so an unchanged playlist
+        # costs a 304 instead of a full transfer
+        headers = {}
+        meta = _load_download_meta(output_dir).get(url, {})
+        previous_path = meta.get('path')
+        if not force_download and previous_path and os.path.exists(previous_path):
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        
+        _print(f"Downloading playlist from {url}...")
+        
+        # Stream the body to disk rather than holding it all in memory
+        with _session_get(url, headers) as response:
+            if response.status_code == 304:
+                _print(f"Playlist not modified, using {previous_path}")
+                return previous_path, meta.get('format', 'm3u')
+            response.raise_for_status()  # Raise an exception for HTTP errors
             
-            if playlist_files:
-                # Sort by date (newest first)
-                playlist_files.sort(reverse=True)
-                newest_file = playlist_files[0]
-                newest_path = os.path.join(output_dir, newest_file)
-                
-                # Extract date from filename
-                try:
-                    file_date_str = newest_file.replace("playlist_", "").replace(".m3u", "")
-                    file_date = datetime.datetime.strptime(file_date_str, "%Y%m%d")
-                    
-                    # Check if file is less than one day old
-                    age = datetime.datetime.now() - file_date
-                    if age.days < 1:
-                        print(f"Using recent playlist file (less than 1 day old): {newest_path}")
-                        return newest_path, 'm3u'
-                    else:
-                        print(f"Existing playlist file is {age.days} days old. Downloading new one.")
-                except ValueError:
-                    # If we can't parse the date, download a new file
-                    pass
-        
-        print(f"Downloading playlist from {url}...")
-        
-        # Use requests to download the file
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        # Save the content to a file
-        with open(output_path, 'wb') as f:
-            f.write(response.content)
-        
-        print(f"Downloaded to {output_path}")
-        
-        # Check if the content is XML by decoding a copy of the content
-        content_text = response.content.decode('utf-8', errors='ignore')
+            response.raw.decode_content = True
+            with open(output_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, COPY_BUFFER_SIZE)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        
+        _print(f"Downloaded to {output_path}")
+        
+        # Check if the content is XML from the start of the file
+        with open(output_path, 'r', encoding='utf-8', errors='ignore') as f:
+            content_text = f.read(4096)
+        file_format = 'm3u'
         if content_text.strip().startswith('<?xml') or '<tv>' in content_text:
-            print("Detected XML format in playlist file")
+            _print("Detected XML format in playlist file")
             # If it's XML, rename the file to reflect that
             xml_path = output_path.replace(".m3u", ".xml")
-            os.rename(output_path, xml_path)
-            return xml_path, 'xml'
+            os.replace(output_path, xml_path)
+            output_path, file_format = xml_path, 'xml'
         
-        return output_path, 'm3u'
+        _save_download_meta(output_dir, url, etag, last_modified, path=output_path, format=file_format)
+        return output_path, file_format
     except Exception as e:
-        print(f"Error downloading playlist from {url}: {e}")
+        _print(f"Error downloading playlist from {url}: {e}")
         return None, None
 
 def use_local_livego_playlist(playlist_path="playlist_data/livego_playlist.xml"):
     """Use a local livego playlist XML file instead of downloading it"""
     if not os.path.exists(playlist_path):
-        print(f"Error: Local livego playlist file not found at {playlist_path}")
-        print("Please make sure the file exists or specify the correct path.")
+        _print(f"Error: Local livego playlist file not found at {playlist_path}")
+        _print("Please make sure the file exists or specify the correct path.")
         return None
     
-    print(f"Using local livego playlist file: {playlist_path}")
+    _print(f"Using local livego playlist file: {playlist_path}")
     return playlist_path, 'xml'
 
 def load_epg_sources(json_file="epg_sources.json"):
@@ -743,27 +1050,36 @@ def load_epg_sources(json_file="epg_sources.json"):
     
     try:
         if not os.path.exists(json_file):
-            print(f"EPG sources file not found: {json_file}")
+            _print(f"EPG sources file not found: {json_file}")
             return {}
         
-        with open(json_file, 'r') as f:
-            data = json.load(f)
+        # The same file is looked up several times per run, so only re-read
+        # it when it has changed
+        path = os.path.abspath(json_file)
+        mtime = os.stat(path).st_mtime_ns
+        cached = _epg_sources_cache.get(path)
+        if cached and cached[0] == mtime:
+            data = cached[1]
+        else:
+            with open(path, 'rb') as f:
+                data = orjson.loads(f.read()) if orjson is not None else json.load(f)
+            _epg_sources_cache[path] = (mtime, data)
         
         # Check if we have the new format with explicit country mappings
         if "country_mappings" in data:
-            print("Using explicit country mappings from EPG sources file")
+            _print("Using explicit country mappings from EPG sources file")
             return data["country_mappings"]
         
         # Fallback to the old format with list of URLs
         if "epg_sources" in data:
-            print("Using legacy EPG sources format, extracting country codes from URLs")
+            _print("Using legacy EPG sources format, extracting country codes from URLs")
             sources = {}
             
             # Extract country code from each URL
             for url in data.get("epg_sources", []):
                 # Extract country code from filename (e.g., epg_ripper_UK1.xml.gz -> UK)
                 filename = os.path.basename(url)
-                match = re.search(r'epg_ripper_([A-Z]{2})(?:_[A-Z]+)?(?:\d*)\.xml', filename)
+                match = _RE_EPG_RIPPER.search(filename)
                 if match:
                     country_code = match.group(1)
                     if country_code in sources:
@@ -778,7 +1094,7 @@ def load_epg_sources(json_file="epg_sources.json"):
         
         return {}
     except Exception as e:
-        print(f"Error loading EPG sources: {e}")
+        _print(f"Error loading EPG sources: {e}")
         return {}
 
 def get_epg_urls_for_country(country_prefix, sources_file="epg_sources.json"):
@@ -787,7 +1103,7 @@ def get_epg_urls_for_country(country_prefix, sources_file="epg_sources.json"):
     sources = load_epg_sources(sources_file)
     
     if not sources:
-        print("No EPG sources found.")
+        _print("No EPG sources found.")
         return []
     
     # Extract country code from prefix (e.g., "UK:" -> "UK")
@@ -800,186 +1116,113 @@ def get_epg_urls_for_country(country_prefix, sources_file="epg_sources.json"):
         if not isinstance(urls, list):
             urls = [urls]
         
-        print(f"Found {len(urls)} EPG sources for country {country_code}")
+        _print(f"Found {len(urls)} EPG sources for country {country_code}")
         for url in urls:
-            print(f"  - {url}")
+            _print(f"  - {url}")
         return urls
     
-    print(f"No EPG sources found for country {country_code}")
+    _print(f"No EPG sources found for country {country_code}")
     return []
 
 def download_multiple_epg_files(urls, output_dir="epg_data"):
     """Download multiple EPG files and return their paths"""
-    downloaded_files = []
+    if not urls:
+        return []
+    
+    # Each worker downloads and then decompresses its own file, so one file's
+    # decompression overlaps with the other downloads; results keep URL order.
+    # The workers report to the same output as the calling thread
+    stream = getattr(_output, 'stream', None)
+    def download(url):
+        with redirect_output(stream):
+            return download_epg_file(url, output_dir)
     
-    for url in urls:
-        downloaded_file = download_epg_file(url, output_dir)
-        if downloaded_file:
-            downloaded_files.append(downloaded_file)
+    with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOAD_WORKERS, len(urls))) as executor:
+        downloaded_files = [f for f in executor.map(download, urls) if f]
     
     return downloaded_files
 
 def consolidate_epg_files(epg_files, output_file):
     """Consolidate multiple EPG files into a single file"""
     if not epg_files:
-        print("No EPG files to consolidate")
+        _print("No EPG files to consolidate")
         return None
     
     if len(epg_files) == 1:
-        print(f"Only one EPG file provided, no consolidation needed: {epg_files[0]}")
+        _print(f"Only one EPG file provided, no consolidation needed: {epg_files[0]}")
         return epg_files[0]
     
     try:
-        # Create a new XML root
-        new_root = ET.Element('tv')
-        new_root.set('generator-info-name', 'Consolidated EPG Generator')
-        
         # Modified: Track channel IDs for reference, but don't use for exclusion
-        channel_ids_count = {}
+        channel_ids_count = Counter()
         program_count = 0
+        # Overlapping sources carry the same programme more than once
+        seen_programs = set()
+        duplicate_programs = 0
         
-        print(f"Consolidating {len(epg_files)} EPG files...")
-        
-        for file_path in epg_files:
-            print(f"Processing {file_path}...")
-            
-            # Parse the EPG file
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            
-            # Copy attributes from the first file
-            if not new_root.attrib:
-                for attr, value in root.attrib.items():
-                    if attr != 'generator-info-name':
-                        new_root.set(attr, value)
-            
-            # Modified: Add all channels, even with duplicate IDs
-            for channel in root.findall(".//channel"):
-                channel_id = channel.get('id')
-                # Instead of skipping, we keep a count for reporting
-                if channel_id in channel_ids_count:
-                    channel_ids_count[channel_id] += 1
-                else:
-                    channel_ids_count[channel_id] = 1
-                
-                # Always add the channel
-                new_root.append(channel)
-            
-            # Add all programs
-            for program in root.findall(".//programme"):
-                new_root.append(program)
-                program_count += 1
-        
-        # Create a new XML tree
-        new_tree = ET.ElementTree(new_root)
+        _print(f"Consolidating {len(epg_files)} EPG files...")
         
         # Create output directory if it doesn't exist
         os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
         
-        # Write the consolidated EPG file
+        # Stream every channel and programme of each file straight into the
+        # consolidated EPG file, clearing each one once written
         with open(output_file, 'wb') as f:
             f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
-            new_tree.write(f, encoding='utf-8')
+            f.write(_tv_start_tag({'generator-info-name': 'Consolidated EPG Generator'}) + b'\n')
+            
+            for file_path in epg_files:
+                _print(f"Processing {file_path}...")
+                
+                context = ET.iterparse(file_path, events=('start', 'end'))
+                _, root = next(context)
+                for event, elem in context:
+                    if event != 'end' or elem.tag not in ('channel', 'programme'):
+                        continue
+                    if elem.tag == 'channel':
+                        # Modified: Add all channels, even with duplicate IDs
+                        # (instead of skipping, we keep a count for reporting)
+                        channel_ids_count[elem.get('id')] += 1
+                    else:
+                        # Ids and times repeat across many programmes, so intern
+                        # them to keep one copy of each string in the seen set
+                        key = (sys.intern(elem.get('channel') or ''),
+                               sys.intern(elem.get('start') or ''),
+                               sys.intern(elem.get('stop') or ''))
+                        if key in seen_programs:
+                            duplicate_programs += 1
+                            root.clear()
+                            continue
+                        seen_programs.add(key)
+                        program_count += 1
+                    # Whatever follows the element may not be parsed yet, so
+                    # give each one its own line rather than a partial tail
+                    elem.tail = '\n'
+                    f.write(ET.tostring(elem, encoding='utf-8'))
+                    root.clear()
+            
+            f.write(b'</tv>')
         
         unique_ids = len(channel_ids_count)
-        total_channels = sum(channel_ids_count.values())
+        total_channels = channel_ids_count.total()
         duplicate_count = total_channels - unique_ids
         
-        print(f"Consolidated EPG file created: {output_file}")
-        print(f"Included {total_channels} total channels ({unique_ids} unique IDs, {duplicate_count} duplicates) and {program_count} program entries")
+        _print(f"Consolidated EPG file created: {output_file}")
+        _print(f"Included {total_channels} total channels ({unique_ids} unique IDs, {duplicate_count} duplicates) and {program_count} program entries")
+        if duplicate_programs:
+            _print(f"Skipped {duplicate_programs} duplicate program entries")
         
         return output_file
     except Exception as e:
-        print(f"Error consolidating EPG files: {e}")
+        _print(f"Error consolidating EPG files: {e}")
         return None
 
-if __name__ == "__main__":
-    # This script can also be run standalone
-    # Parse command line arguments
-    if len(sys.argv) < 2:
-        print("Usage: python match_channels.py [epg_file.xml] [options]")
-        print("Options:")
-        print("  --playlist-url URL        URL to download the playlist from")
-        print("  --country-prefix PREFIX   Filter channels by country prefix (e.g., 'UK:', 'US:', 'IN:')")
-        print("  --threshold N             Set the matching threshold (default: 70)")
-        print("  --output-dir DIR          Directory to save filtered EPG files (default: export_epg)")
-        print("  --only-perfect            Include only perfect matches (100% score)")
-        print("  --verbose                 Show detailed matching information")
-        print("  --export-csv FILENAME     Export matches to CSV file")
-        print("  --show-all                Show all channels including those without matches")
-        print("  --download-dir DIR        Directory to save downloaded files (default: downloads)")
-        print("  --playlist-dir DIR        Directory to save downloaded playlists (default: playlist_data)")
-        print("  --epg-dir DIR             Directory to save downloaded EPG files (default: epg_data)")
-        print("  --epg-sources FILE        JSON file with EPG sources (default: epg_sources.json)")
-        print("  --force-download          Force download of playlist even if recent file exists")
-        sys.exit(1)
-    
-    # Parse options first to get parameters
-    country_prefix = None
-    threshold = 70
-    output_dir = "export_epg"
-    only_perfect = False
-    verbose = False
-    export_csv = None
-    show_all = False
-    download_dir = "downloads"
-    playlist_dir = "playlist_data"
-    epg_dir = "epg_data"
-    epg_sources_file = "epg_sources.json"
-    epg_file = None
-    playlist_url = None
-    force_download = False
-    
-    i = 1
-    while i < len(sys.argv):
-        if sys.argv[i] == "--country-prefix" and i + 1 < len(sys.argv):
-            country_prefix = sys.argv[i + 1]
-            i += 2
-        elif sys.argv[i] == "--playlist-url" and i + 1 < len(sys.argv):
-            playlist_url = sys.argv[i + 1]
-            i += 2
-        elif sys.argv[i] == "--force-download":
-            force_download = True
-            i += 1
-        elif sys.argv[i] == "--threshold" and i + 1 < len(sys.argv):
-            threshold = int(sys.argv[i + 1])
-            i += 2
-        elif sys.argv[i] == "--output-dir" and i + 1 < len(sys.argv):
-            output_dir = sys.argv[i + 1]
-            i += 2
-        elif sys.argv[i] == "--export-csv" and i + 1 < len(sys.argv):
-            export_csv = sys.argv[i + 1]
-            i += 2
-        elif sys.argv[i] == "--download-dir" and i + 1 < len(sys.argv):
-            download_dir = sys.argv[i + 1]
-            playlist_dir = download_dir
-            epg_dir = download_dir
-            i += 2
-        elif sys.argv[i] == "--playlist-dir" and i + 1 < len(sys.argv):
-            playlist_dir = sys.argv[i + 1]
-            i += 2
-        elif sys.argv[i] == "--epg-dir" and i + 1 < len(sys.argv):
-            epg_dir = sys.argv[i + 1]
-            i += 2
-        elif sys.argv[i] == "--epg-sources" and i + 1 < len(sys.argv):
-            epg_sources_file = sys.argv[i + 1]
-            i += 2
-        elif sys.argv[i] == "--only-perfect":
-            only_perfect = True
-            i += 1
-        elif sys.argv[i] == "--verbose":
-            verbose = True
-            i += 1
-        elif sys.argv[i] == "--show-all":
-            show_all = True
-            i += 1
-        elif not epg_file and not sys.argv[i].startswith("--"):
-            # First non-option argument is the EPG file
-            epg_file = sys.argv[i]
-            i += 1
-        else:
-            i += 1
-    
+def run_for_country(country_prefix, playlist_url, force_download=False, threshold=70,
+                    output_dir="export_epg", only_perfect=False, verbose=False, export_csv=None,
+                    show_all=False, playlist_dir="playlist_data", epg_dir="epg_data",
+                    epg_sources_file="epg_sources.json", epg_file=None, playlist_file=None,
+                    parallel=True):
+    """Match the playlist against the EPG for a country and write its filtered EPG file"""
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
 
@@ -988,7 +1231,7 @@ if __name__ == "__main__":
         epg_urls = get_epg_urls_for_country(country_prefix, epg_sources_file)
         if epg_urls:
             if len(epg_urls) > 1:
-                print(f"Found multiple EPG sources for {country_prefix}, will consolidate them.")
+                _print(f"Found multiple EPG sources for {country_prefix}, will consolidate them.")
                 # Download all EPG files
                 downloaded_epgs = download_multiple_epg_files(epg_urls, epg_dir)
                 if downloaded_epgs:
@@ -996,15 +1239,15 @@ if __name__ == "__main__":
                     consolidated_file = os.path.join(epg_dir, f"consolidated_{country_prefix.rstrip(':')}.xml")
                     epg_file = consolidate_epg_files(downloaded_epgs, consolidated_file)
                     if not epg_file:
-                        print("Failed to consolidate EPG files.")
-                        sys.exit(1)
+                        _print("Failed to consolidate EPG files.")
+                        return False
                 else:
-                    print("Failed to download EPG files.")
-                    sys.exit(1)
+                    _print("Failed to download EPG files.")
+                    return False
             else:
                 # Just one EPG file, use it directly
                 epg_file = epg_urls[0]
-                print(f"Using EPG file for {country_prefix}: {epg_file}")
+                _print(f"Using EPG file for {country_prefix}: {epg_file}")
                 
                 # Download the EPG file if it's a URL
                 if epg_file.startswith(('http://', 'https://')):
@@ -1012,58 +1255,54 @@ if __name__ == "__main__":
                     if downloaded_epg:
                         epg_file = downloaded_epg
                     else:
-                        print(f"Failed to download EPG from {epg_file}")
-                        sys.exit(1)
+                        _print(f"Failed to download EPG from {epg_file}")
+                        return False
         else:
-            print(f"Error: No EPG file specified and no matching EPG source found for country prefix {country_prefix}.")
-            sys.exit(1)
+            _print(f"Error: No EPG file specified and no matching EPG source found for country prefix {country_prefix}.")
+            return False
 
     # If still no EPG file specified, show error
     if not epg_file:
-        print("Error: No EPG file specified. Please provide an EPG file or use --country-prefix with a known country.")
-        sys.exit(1)
+        _print("Error: No EPG file specified. Please provide an EPG file or use --country-prefix with a known country.")
+        return False
 
     try:
         import requests
         
-        # Download playlist from the specified URL
-        downloaded_playlist, format_type = download_playlist_from_url(playlist_url, playlist_dir, force_download)
-        if downloaded_playlist:
-            playlist_file = downloaded_playlist
-            print(f"Using playlist from {playlist_url}: {playlist_file}")
-        else:
-            print(f"Failed to download playlist from {playlist_url}")
-            sys.exit(1)
+        # Download playlist from the specified URL, unless a local one was given
+        if not playlist_file:
+            downloaded_playlist, format_type = download_playlist_from_url(playlist_url, playlist_dir, force_download)
+            if downloaded_playlist:
+                playlist_file = downloaded_playlist
+                _print(f"Using playlist from {playlist_url}: {playlist_file}")
+            else:
+                _print(f"Failed to download playlist from {playlist_url}")
+                return False
         
-        # Check if epg_file is a URL and download it if needed
+        # Download the EPG file if it was given as a URL
         if epg_file.startswith(('http://', 'https://')):
-            epg_urls = get_epg_urls_for_country(country_prefix, epg_sources_file)
-            if epg_urls:
-                epg_files = download_multiple_epg_files(epg_urls, epg_dir)
-                if epg_files:
-                    epg_file = consolidate_epg_files(epg_files, epg_dir)
-                else:
-                    print(f"Failed to download EPG files for {country_prefix}")
-                    sys.exit(1)
+            downloaded_epg = download_epg_file(epg_file, epg_dir)
+            if downloaded_epg:
+                epg_file = downloaded_epg
             else:
-                print(f"Error: No EPG files found for {country_prefix}")
-                sys.exit(1)
+                _print(f"Failed to download EPG from {epg_file}")
+                return False
     except ImportError:
-        print("Error: The requests package is required for downloading files.")
-        print("Please install it using: pip install requests")
-        sys.exit(1)
+        _print("Error: The requests package is required for downloading files.")
+        _print("Please install it using: pip install requests")
+        return False
     
     # Load playlist channels
     playlist_channels = load_playlist_channels(playlist_file, country_prefix)
     
     if not playlist_channels:
-        print(f"No channels found in playlist: {playlist_file}")
+        _print(f"No channels found in playlist: {playlist_file}")
         if country_prefix:
-            print(f"Note: You specified a country prefix '{country_prefix}', which might be filtering out all channels.")
-        sys.exit(1)
+            _print(f"Note: You specified a country prefix '{country_prefix}', which might be filtering out all channels.")
+        return False
     
     # Match channels
-    matches = match_channels(playlist_channels, epg_file, threshold, not verbose)
+    matches = match_channels(playlist_channels, epg_file, threshold, not verbose, parallel)
     
     # Display matches
     display_matches(matches, show_all, only_perfect)
@@ -1079,27 +1318,43 @@ if __name__ == "__main__":
     else:
         output_file = os.path.join(output_dir, "epg.xml")
     
-    print(f"Generating filtered EPG file: {output_file}")
+    _print(f"Generating filtered EPG file: {output_file}")
     generate_filtered_epg_xml(matches, epg_file, output_file, only_perfect)
+    
+    return True
 
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
-
-    # If no EPG file specified but country_prefix is provided, try to get it from epg_sources.json
-    if not epg_file and country_prefix:
-        epg_urls = get_epg_urls_for_country(country_prefix, epg_sources_file)
-        if epg_urls:
-            epg_files = download_multiple_epg_files(epg_urls, epg_dir)
-            if epg_files:
-                epg_file = consolidate_epg_files(epg_files, epg_dir)
-            else:
-                print(f"Failed to download EPG files for {country_prefix}")
-                sys.exit(1)
-        else:
-            print(f"Error: No EPG files found for {country_prefix}")
-            sys.exit(1)
-
-    # If still no EPG file specified, show error
-    if not epg_file:
-        print("Error: No EPG file specified. Please provide an EPG file or use --country-prefix with a known country.")
-        sys.exit(1) 
\ No newline at end of file
+if __name__ == "__main__":
+    # This script can also be run standalone
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Match playlist channels against EPG data and write a filtered EPG file.')
+    parser.add_argument('epg_file', nargs='?', help='EPG XML file to match against (default: look up by --country-prefix)')
+    parser.add_argument('--playlist-url', help='URL to download the playlist from')
+    parser.add_argument('--country-prefix', help="Filter channels by country prefix (e.g., 'UK:', 'US:', 'IN:')")
+    parser.add_argument('--threshold', type=int, default=70, help='Set the matching threshold (default: 70)')
+    parser.add_argument('--output-dir', default='export_epg', help='Directory to save filtered EPG files (default: export_epg)')
+    parser.add_argument('--only-perfect', action='store_true', help='Include only perfect matches (100%% score)')
+    parser.add_argument('--verbose', action='store_true', help='Show detailed matching information')
+    parser.add_argument('--export-csv', metavar='FILENAME', help='Export matches to CSV file')
+    parser.add_argument('--show-all', action='store_true', help='Show all channels including those without matches')
+    parser.add_argument('--download-dir', help='Directory to save downloaded files (sets both --playlist-dir and --epg-dir)')
+    parser.add_argument('--playlist-dir', help='Directory to save downloaded playlists (default: playlist_data)')
+    parser.add_argument('--epg-dir', help='Directory to save downloaded EPG files (default: epg_data)')
+    parser.add_argument('--epg-sources', default='epg_sources.json', help='JSON file with EPG sources (default: epg_sources.json)')
+    parser.add_argument('--force-download', action='store_true', help='Force download of playlist even if recent file exists')
+    
+    if len(sys.argv) < 2:
+        parser.print_help()
+        sys.exit(1)
+    
+    args = parser.parse_args()
+    
+    # An explicit --playlist-dir/--epg-dir wins over --download-dir
+    playlist_dir = args.playlist_dir or args.download_dir or "playlist_data"
+    epg_dir = args.epg_dir or args.download_dir or "epg_data"
+    
+    if not run_for_country(args.country_prefix, args.playlist_url, force_download=args.force_download,
+                           threshold=args.threshold, output_dir=args.output_dir, only_perfect=args.only_perfect,
+                           verbose=args.verbose, export_csv=args.export_csv, show_all=args.show_all,
+                           playlist_dir=playlist_dir, epg_dir=epg_dir,
+                           epg_sources_file=args.epg_sources, epg_file=args.epg_file):
+        sys.exit(1)
@@ -1,14 +1,26 @@
 #!/usr/bin/env python3
+import io
 import os
 import sys
 import json
-import subprocess
 import time
 import argparse
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    # Fall back to the json module in load_country_mappings
+    orjson = None
+
+from match_channels import download_playlist_from_url, redirect_output, run_for_country
 
 # Default playlist URL
 DEFAULT_PLAYLIST_URL = ""
+# Maximum number of countries processed at the same time
+MAX_COUNTRY_WORKERS = 4
+
 def load_country_mappings(json_file="epg_sources.json"):
     """Load country mappings from JSON file"""
     try:
@@ -16,8 +28,8 @@ def load_country_mappings(json_file="epg_sources.json"):
             print(f"EPG sources file not found: {json_file}")
             return {}
         
-        with open(json_file, 'r') as f:
-            data = json.load(f)
+        with open(json_file, 'rb') as f:
+            data = orjson.loads(f.read()) if orjson is not None else json.load(f)
         
         if "country_mappings" in data:
             return data["country_mappings"]
@@ -27,6 +39,14 @@ def load_country_mappings(json_file="epg_sources.json"):
         print(f"Error loading country mappings: {e}")
         return {}
 
+def _clear_dir(directory):
+    """Delete the files directly inside a directory"""
+    # scandir's entries already know their type, saving a stat() per file
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file():
+                os.unlink(entry.path)
+
 def clear_data_directories(clear_exports=False):
     """Clear data directories before processing
     
@@ -36,55 +56,36 @@ def clear_data_directories(clear_exports=False):
     # Clear EPG data
     if clear_exports and os.path.exists('epg_data'):
         print("Clearing EPG data directory...")
-        for file in os.listdir('epg_data'):
-            file_path = os.path.join('epg_data', file)
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
+        _clear_dir('epg_data')
     
     # Clear playlist data
     if clear_exports and os.path.exists('playlist_data'):
         print("Clearing playlist data directory...")
-        for file in os.listdir('playlist_data'):
-            file_path = os.path.join('playlist_data', file)
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
+        _clear_dir('playlist_data')
 
-def run_match_channels(country_prefix, playlist_url, force_download=False):
-    """Run match_channels.py for a specific country"""
-    print(f"\n{'='*80}")
-    print(f"Processing country: {country_prefix}")
-    print(f"{'='*80}\n")
-    
-    cmd = [
-        "python3", "match_channels.py",
-        "--playlist-url", playlist_url,
-        "--country-prefix", f"{country_prefix}:",
-        "--only-perfect",
-        "--output-dir", "export_epg"
-    ]
-    
-    if force_download:
-        cmd.append("--force-download")
-    
-    print(f"Running command: {' '.join(cmd)}")
-    
+def run_match_channels(country_prefix, playlist_url, force_download=False, playlist_file=None, output=None):
+    """Run the channel matching for a specific country, reporting to output (default stdout)"""
+    print(f"\n{'='*80}", file=output)
+    print(f"Processing country: {country_prefix}", file=output)
+    print(f"{'='*80}\n", file=output)
+    
+    # Countries run side by side in threads, so each one matches on its own
+    # thread rather than starting a process pool or scoring on every core
     try:
-        # Run the command and capture output
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Print the output
-        print(result.stdout)
-        
-        if result.returncode != 0:
-            print(f"Error processing {country_prefix}:")
-            print(result.stderr)
-            return False
-        
-        return True
+        with redirect_output(output):
+            return run_for_country(f"{country_prefix}:", playlist_url, force_download,
+                                   only_perfect=True, output_dir="export_epg",
+                                   playlist_file=playlist_file, parallel=False)
     except Exception as e:
-        print(f"Error running match_channels.py for {country_prefix}: {e}")
+        print(f"Error running match_channels for {country_prefix}: {e}", file=output)
         return False
 
+def _run_country_buffered(country_prefix, playlist_url, force_download, playlist_file):
+    """Run one country with its output collected, so concurrent countries don't interleave"""
+    buffer = io.StringIO()
+    success = run_match_channels(country_prefix, playlist_url, force_download, playlist_file, buffer)
+    return success, buffer.getvalue()
+
 def main():
     parser = argparse.ArgumentParser(description='Process EPG data for multiple countries.')
     parser.add_argument('--countries', nargs='+', help='List of country codes to process (default: all countries in epg_sources.json)')
@@ -114,16 +115,37 @@ def main():
     successful_countries = []
     failed_countries = []
     
+    known_countries = []
     for country in countries_to_process:
         if country in country_mappings:
-            if run_match_channels(country, args.playlist_url, args.force_download):
-                successful_countries.append(country)
-            else:
-                failed_countries.append(country)
+            known_countries.append(country)
         else:
             print(f"Warning: Country {country} not found in epg_sources.json")
             failed_countries.append(country)
     
+    # Every country uses the same playlist, so download it once up front
+    # rather than having concurrent countries race to write the same file
+    playlist_file = None
+    if known_countries:
+        playlist_file, _ = download_playlist_from_url(args.playlist_url, "playlist_data", args.force_download)
+        if not playlist_file:
+            print(f"Failed to download playlist from {args.playlist_url}")
+            sys.exit(1)
+    
+    # Countries spend much of their time downloading EPG files, so run a few
+    # at once in this process and print each one's output when it finishes
+    with ThreadPoolExecutor(max_workers=MAX_COUNTRY_WORKERS) as executor:
+        results = executor.map(
+            lambda country: _run_country_buffered(country, args.playlist_url,
+                                                  args.force_download, playlist_file),
+            known_countries)
+        for country, (success, log) in zip(known_countries, results):
+            sys.stdout.write(log)
+            if success:
+                successful_countries.append(country)
+            else:
+                failed_countries.append(country)
+    
     # Print summary
     print(f"\n{'='*80}")
     print("Processing Summary")